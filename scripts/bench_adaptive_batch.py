@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Benchmark del lote adaptativo (sentiment_dl_worker --adaptive-batch) contra lotes fijos
+bajo carga escalonada.
+
+Simulacion de eventos discretos con reloj virtual (corre en segundos): llegadas Poisson
+por escalon (--scenario nombre=tasa:segs,tasa:segs,...) y un worker serial que toma
+min(lote, backlog), paga claim + infer(n) + sink(n) y escribe. El BatchController es el
+mismo objeto que usa el worker, con el reloj virtual.
+
+Costo por lote:
+  - sintetico (default): fijo + por_doc * n con jitter (--infer-fixed-ms, --infer-per-doc-ms, ...)
+  - medido: con --corpus se mide el modelo real (encode_batch + infer_batch) en varios
+    tamanos y se interpola; el sink sigue siendo sintetico.
+
+Reporta por politica y escenario latencia extremo a extremo (llegada -> commit)
+p50/p95/p99, throughput, backlog maximo y p95 por escalon, en JSON por linea.
+
+USO
+  python scripts/bench_adaptive_batch.py --fixed 16,64,256 --target-p95-ms 1000
+  python scripts/bench_adaptive_batch.py --corpus corpus.jsonl --scenario "burst=20:30,300:30,20:30"
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import random
+import sys
+import time
+
+from sentiment_dl_worker import BatchController
+
+DEFAULT_SCENARIOS = [
+    "goteo-rafaga=20:30,400:30,20:30",
+    "rampa=50:20,150:20,300:20,600:20,50:20",
+]
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Lote adaptativo vs fijo bajo carga escalonada (simulado)")
+    p.add_argument("--scenario", action="append", default=None,
+                   help="nombre=tasa:segs,tasa:segs,... (repetible); default: goteo-rafaga y rampa")
+    p.add_argument("--fixed", default="16,64,256", help="tamanos fijos a comparar")
+    p.add_argument("--batch-size", type=int, default=64, help="lote inicial del adaptativo")
+    p.add_argument("--min-batch", type=int, default=8)
+    p.add_argument("--max-batch", type=int, default=512)
+    p.add_argument("--target-p95-ms", type=float, default=1000.0)
+    p.add_argument("--adapt-every", type=float, default=2.0)
+    # costo sintetico por lote
+    p.add_argument("--claim-ms", type=float, default=3.0)
+    p.add_argument("--infer-fixed-ms", type=float, default=40.0)
+    p.add_argument("--infer-per-doc-ms", type=float, default=2.0)
+    p.add_argument("--sink-fixed-ms", type=float, default=8.0)
+    p.add_argument("--sink-per-doc-ms", type=float, default=0.1)
+    p.add_argument("--jitter", type=float, default=0.1, help="desvio relativo del costo por lote")
+    # costo medido
+    p.add_argument("--corpus", default=None, help="mide el modelo real (txt o jsonl de export_sentiment140.py)")
+    p.add_argument("--model", default="tabularisai/multilingual-sentiment-analysis")
+    p.add_argument("--max-length", type=int, default=256)
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--verbose", action="store_true", help="muestra las decisiones del controlador")
+    return p.parse_args()
+
+
+def pct(data, q: float) -> float:
+    data = sorted(data)
+    return data[min(len(data) - 1, int(q / 100.0 * len(data)))] if data else 0.0
+
+
+def parse_scenario(spec: str):
+    name, _, steps = spec.partition("=")
+    out = []
+    for part in steps.split(","):
+        rate, secs = part.split(":")
+        out.append((float(rate), float(secs)))
+    return name, out
+
+
+def arrivals_for(steps, rng: random.Random):
+    """Llegadas Poisson por escalon; devuelve (tiempos, limites de escalon)."""
+    times, bounds, t0 = [], [], 0.0
+    for rate, secs in steps:
+        t = t0
+        while rate > 0:
+            t += rng.expovariate(rate)
+            if t >= t0 + secs:
+                break
+            times.append(t)
+        t0 += secs
+        bounds.append(t0)
+    return times, bounds
+
+
+def synthetic_infer(a):
+    return lambda n: a.infer_fixed_ms + a.infer_per_doc_ms * n
+
+
+def measured_infer(a):
+    """Mide encode+infer reales en tamanos 1..max_batch y devuelve una interpolacion lineal."""
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    from bench_batching import load_corpus
+    from sentiment_dl_worker import encode_batch, infer_batch
+
+    docs = load_corpus(a.corpus, a.max_batch)
+    tok = AutoTokenizer.from_pretrained(a.model)
+    mdl = AutoModelForSequenceClassification.from_pretrained(a.model)
+    mdl.eval()
+    sizes = sorted({s for s in (1, 8, 32, 64, 128, 256, a.max_batch) if s <= len(docs)})
+    infer_batch(mdl, encode_batch(tok, docs[:8], a.max_length), mdl.config.id2label)  # calentamiento
+    pts = []
+    for s in sizes:
+        t0 = time.perf_counter()
+        infer_batch(mdl, encode_batch(tok, docs[:s], a.max_length), mdl.config.id2label)
+        pts.append((s, (time.perf_counter() - t0) * 1000.0))
+    print(json.dumps({"calibracion_ms": dict(pts)}), flush=True)
+
+    def cost(n):
+        i = bisect.bisect_left([s for s, _ in pts], n)
+        if i == 0:
+            return pts[0][1]
+        if i >= len(pts):
+            (s0, m0), (s1, m1) = pts[-2], pts[-1]
+        else:
+            (s0, m0), (s1, m1) = pts[i - 1], pts[i]
+        return m0 + (m1 - m0) * (n - s0) / max(s1 - s0, 1)
+
+    return cost
+
+
+def simulate(policy: str, times, bounds, infer_cost, a, log) -> dict:
+    rng = random.Random(a.seed)
+    now = [0.0]  # reloj virtual (s)
+    nxt = 0      # primera llegada aun no tomada
+
+    def backlog(limit: int) -> int:
+        return min(limit, bisect.bisect_right(times, now[0]) - nxt)
+
+    ctl = None
+    if policy == "adaptive":
+        ctl = BatchController(a.batch_size, a.min_batch, a.max_batch, a.target_p95_ms, backlog, log,
+                              a.adapt_every, clock=lambda: now[0])
+        size_fn = ctl.size
+    else:
+        fixed = int(policy.split("-")[1])
+        size_fn = lambda: fixed  # noqa: E731
+
+    lat = [0.0] * len(times)
+    sizes = []
+    max_backlog = 0
+    while nxt < len(times):
+        avail = bisect.bisect_right(times, now[0]) - nxt
+        if avail == 0:
+            now[0] = times[nxt]
+            continue
+        max_backlog = max(max_backlog, avail)
+        b = min(size_fn(), avail)
+        jit = lambda: max(0.1, rng.gauss(1.0, a.jitter))  # noqa: E731
+        infer_ms = infer_cost(b) * jit()
+        sink_ms = (a.sink_fixed_ms + a.sink_per_doc_ms * b) * jit()
+        t_claim = now[0]
+        now[0] += (a.claim_ms + infer_ms + sink_ms) / 1000.0
+        for j in range(nxt, nxt + b):
+            lat[j] = (now[0] - times[j]) * 1000.0
+        if ctl is not None:
+            ctl.observe(b, infer_ms, sink_ms, (now[0] - t_claim) * 1000.0, (t_claim - times[nxt]) * 1000.0)
+        sizes.append(b)
+        nxt += b
+
+    steps = []
+    lo = 0
+    for k, hi_t in enumerate(bounds):
+        hi = bisect.bisect_left(times, hi_t)
+        seg = lat[lo:hi]
+        steps.append({"step": k, "msgs": len(seg), "p95_ms": round(pct(seg, 95), 1)})
+        lo = hi
+    makespan = now[0] - (times[0] if times else 0.0)
+    return {"policy": policy, "msgs": len(times), "batches": len(sizes),
+            "avg_batch": round(sum(sizes) / max(len(sizes), 1), 1),
+            "p50_ms": round(pct(lat, 50), 1), "p95_ms": round(pct(lat, 95), 1), "p99_ms": round(pct(lat, 99), 1),
+            "docs_per_sec": round(len(times) / max(makespan, 1e-9), 1), "max_backlog": max_backlog,
+            "steps": steps, "changes": ctl.changes if ctl is not None else 0}
+
+
+def main():
+    a = parse_args()
+    log = logging.getLogger("bench_adaptive")
+    log.addHandler(logging.StreamHandler(sys.stderr))
+    log.setLevel(logging.INFO if a.verbose else logging.WARNING)
+    infer_cost = measured_infer(a) if a.corpus else synthetic_infer(a)
+    policies = [f"fixed-{int(x)}" for x in a.fixed.split(",") if x.strip()] + ["adaptive"]
+    for spec in a.scenario or DEFAULT_SCENARIOS:
+        name, steps = parse_scenario(spec)
+        times, bounds = arrivals_for(steps, random.Random(a.seed))
+        for pol in policies:
+            res = simulate(pol, times, bounds, infer_cost, a, log)
+            print(json.dumps({"scenario": name, **res}), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark: batching fijo vs batching por buckets de longitud (sentiment_dl_worker).
+
+Corre el mismo corpus por el modelo con ambos modos y reporta docs/seg y
+proporcion de padding. Verifica ademas que cada modo asigna la misma etiqueta
+a cada documento (el mapeo a _id se conserva).
+
+USO
+  python scripts/export_sentiment140.py --out corpus.jsonl --fmt jsonl --max 5000 --shuffle
+  python scripts/bench_batching.py --corpus corpus.jsonl --n 2000 --batch-size 64 --max-tokens 4096
+
+Requisitos:
+  pip install torch transformers
+"""
+
+import argparse
+import json
+import sys
+import time
+from typing import List
+
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+from sentiment_dl_worker import PaddingStats, encode_batch, infer_batch
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Benchmark de batching fijo vs por buckets")
+    p.add_argument("--corpus", required=True, help="salida de export_sentiment140.py (txt o jsonl)")
+    p.add_argument("--n", type=int, default=2000, help="documentos a procesar por modo")
+    p.add_argument("--model", default="tabularisai/multilingual-sentiment-analysis")
+    p.add_argument("--max-length", type=int, default=256)
+    p.add_argument("--batch-size", type=int, default=64)
+    p.add_argument("--max-tokens", type=int, default=0, help="presupuesto de tokens por sub-lote (modo bucket)")
+    p.add_argument("--threads", type=int, default=0, help="torch.set_num_threads; 0 = default")
+    return p.parse_args()
+
+
+def load_corpus(path: str, n: int) -> List[dict]:
+    docs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for i, ln in enumerate(f):
+            ln = ln.strip()
+            if not ln:
+                continue
+            doc = {"_id": str(i), "comment": ln}
+            if path.endswith(".jsonl"):
+                rec = json.loads(ln)
+                doc["comment"] = rec.get("text", "")
+                doc["label"] = rec.get("label")
+            docs.append(doc)
+            if n and len(docs) >= n:
+                break
+    return docs
+
+
+def run_mode(name: str, docs: List[dict], tok, mdl, id2label, args, bucketing: bool) -> dict:
+    pad = PaddingStats()
+    labels = {}
+    # calentamiento: un lote fuera de la medicion
+    infer_batch(mdl, encode_batch(tok, docs[: args.batch_size], args.max_length, bucketing, args.max_tokens), id2label)
+    t0 = time.perf_counter()
+    for i in range(0, len(docs), args.batch_size):
+        batch = docs[i:i + args.batch_size]
+        parts = encode_batch(tok, batch, args.max_length, bucketing, args.max_tokens, pad)
+        for d, label, _score in infer_batch(mdl, parts, id2label):
+            labels[d["_id"]] = label
+    wall = time.perf_counter() - t0
+    res = {"mode": name, "docs": len(labels), "secs": round(wall, 3),
+           "docs_per_sec": round(len(labels) / wall, 1), "padding_ratio": round(pad.ratio(), 4)}
+    print(json.dumps(res), flush=True)
+    return {"res": res, "labels": labels}
+
+
+def main():
+    args = parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    docs = load_corpus(args.corpus, args.n)
+    if not docs:
+        print("corpus vacio", file=sys.stderr)
+        return 2
+
+    tok = AutoTokenizer.from_pretrained(args.model)
+    mdl = AutoModelForSequenceClassification.from_pretrained(args.model)
+    mdl.eval()
+    id2label = mdl.config.id2label
+
+    fixed = run_mode("fixed", docs, tok, mdl, id2label, args, bucketing=False)
+    bucket = run_mode("bucket", docs, tok, mdl, id2label, args, bucketing=True)
+
+    same = sum(1 for k, v in fixed["labels"].items() if bucket["labels"].get(k) == v)
+    speedup = bucket["res"]["docs_per_sec"] / max(fixed["res"]["docs_per_sec"], 1e-9)
+    print(f"speedup={speedup:.2f}x label_agreement={same}/{len(fixed['labels'])}", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Benchmark de ingesta Kafka -> Mongo con --parallel N, sin broker real.
+
+Un stand-in de KafkaConsumer sirve mensajes desde un archivo grabado (una linea =
+un value del topic, p.ej. el JSON que produce send_kafka_burst.py) o sinteticos,
+repartidos en --partitions particiones. Cada proceso posee las particiones
+p % N == idx, igual que una asignacion del grupo, y corre el mismo
+run_consumer() de consumer_to_mongo.py (to_minimal, ReplaceOne, BulkWriter, commits).
+
+Con --mongo none las escrituras se descartan: mide el techo de CPU del camino
+decode/armado de lotes. Con una URI se escribe en Mongo real (p.ej. un contenedor local).
+
+USO
+  python scripts/bench_consumer.py --synthetic 200000 --partitions 8 --parallel 1,2,4 --mongo none
+  python scripts/bench_consumer.py --messages recorded.jsonl --partitions 8 --parallel 1,2,4 \
+    --mongo "mongodb://127.0.0.1:27017" --db benchdb --coll raw_bench
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import sys
+import time
+import types
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from kafka.structs import TopicPartition
+
+from consumer_to_mongo import run_consumer
+
+Rec = namedtuple("Rec", ["value", "offset"])
+
+CORPUS = [
+    "me encanta este servicio",
+    "el sistema esta caido",
+    "la experiencia fue neutral",
+    "excelente atencion",
+]
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Throughput de consumer_to_mongo --parallel N sin broker")
+    p.add_argument("--messages", default=None, help="archivo con un value de Kafka por linea")
+    p.add_argument("--synthetic", type=int, default=100000, help="mensajes sinteticos si no hay --messages")
+    p.add_argument("--partitions", type=int, default=8)
+    p.add_argument("--parallel", default="1,2,4", help="lista de N a probar")
+    p.add_argument("--mongo", default="none", help="URI de Mongo o 'none' para descartar escrituras")
+    p.add_argument("--db", default="benchdb")
+    p.add_argument("--coll", default="raw_bench")
+    p.add_argument("--batch", type=int, default=500)
+    p.add_argument("--max-latency-ms", type=int, default=200)
+    p.add_argument("--max-inflight", type=int, default=4)
+    return p.parse_args()
+
+
+def load_values(a):
+    if a.messages:
+        with open(a.messages, "rb") as f:
+            return [ln.rstrip(b"\n") for ln in f if ln.strip()]
+    now = datetime.now(timezone.utc).isoformat()
+    return [
+        json.dumps({"user_id": f"user_{i % 100000:05d}", "comment": CORPUS[i % len(CORPUS)],
+                    "meta": {"id": str(uuid.uuid4()), "client_id": "bench", "ts": now}}).encode("utf-8")
+        for i in range(a.synthetic)
+    ]
+
+
+class FileConsumer:
+    """
+    Stand-in minimo de KafkaConsumer: poll/commit/close sobre particiones en memoria.
+    Al agotar los datos lanza KeyboardInterrupt, que run_consumer trata como fin ordenado.
+    """
+
+    def __init__(self, parts):
+        self.parts = parts  # {TopicPartition: [values]}
+        self.pos = {tp: 0 for tp in parts}
+        self.committed = {}
+
+    def poll(self, timeout_ms=0, max_records=500):
+        out = {}
+        budget = max_records
+        for tp, vals in self.parts.items():
+            i = self.pos[tp]
+            if i >= len(vals) or budget <= 0:
+                continue
+            take = vals[i:i + budget]
+            out[tp] = [Rec(v, i + k) for k, v in enumerate(take)]
+            self.pos[tp] = i + len(take)
+            budget -= len(take)
+        if not out:
+            raise KeyboardInterrupt
+        return out
+
+    def commit(self, offsets=None):
+        for tp, om in (offsets or {}).items():
+            self.committed[tp] = om.offset
+
+    def close(self):
+        pass
+
+
+class NullCollection:
+    def bulk_write(self, ops, ordered=False):
+        return None
+
+
+def bench_proc(idx, n, values, a, q_out):
+    parts = {}
+    for p in range(a.partitions):
+        if p % n == idx:
+            parts[TopicPartition("bench", p)] = [v for i, v in enumerate(values) if i % a.partitions == p]
+    col = NullCollection()
+    mc = None
+    if a.mongo != "none":
+        from pymongo import MongoClient
+        mc = MongoClient(a.mongo)
+        col = mc[a.db][a.coll]
+    ca = types.SimpleNamespace(parallel=n, batch=a.batch, max_latency_ms=a.max_latency_ms,
+                               max_inflight=a.max_inflight, report_every=3600.0, idle_exit=0,
+                               trace=False, metrics_file=None, metrics_every=10.0,
+                               write_retries=5, dead_letter=None, revoke_timeout=10.0)
+    t0 = time.perf_counter()
+    written = run_consumer(ca, idx, consumer=FileConsumer(parts), col=col)
+    q_out.put((written, time.perf_counter() - t0))
+    if mc is not None:
+        mc.close()
+
+
+def main():
+    a = parse_args()
+    values = load_values(a)
+    if not values:
+        print("sin mensajes", file=sys.stderr)
+        return 2
+    ctx = mp.get_context("fork")
+    base = None
+    for n in [int(x) for x in a.parallel.split(",") if x.strip()]:
+        q_out = ctx.Queue()
+        procs = [ctx.Process(target=bench_proc, args=(i, n, values, a, q_out)) for i in range(n)]
+        for pr in procs:
+            pr.start()
+        res = [q_out.get() for _ in procs]
+        for pr in procs:
+            pr.join()
+        written = sum(r[0] for r in res)
+        wall = max(r[1] for r in res)
+        rate = written / wall
+        base = base or rate
+        print(json.dumps({"parallel": n, "docs": written, "secs": round(wall, 3),
+                          "docs_per_sec": round(rate, 1), "speedup": round(rate / base, 2)}), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
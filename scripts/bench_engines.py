@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Compara los backends de inferencia del worker (--engine) contra eager fp32.
+
+Para cada engine reporta:
+  - label_agreement : fraccion de documentos con la misma etiqueta que eager
+  - score_drift     : |score - score_eager| medio y maximo
+  - polarity_acc    : acierto de polaridad contra la etiqueta de Sentiment140
+                      (0 = neg/vneg, 4 = pos/vpos; 'neu' no cuenta)
+  - docs_per_sec y latencia por lote p50/p95
+
+USO
+  python scripts/export_sentiment140.py --out sample.jsonl --fmt jsonl --max 2000 --shuffle
+  python scripts/bench_engines.py --corpus sample.jsonl --n 1000 --engines eager,int8-dynamic,torchscript
+
+Requisitos:
+  pip install torch transformers
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+from bench_batching import load_corpus
+from sentiment_dl_worker import LatencyWindow, build_engine, encode_batch, infer_batch
+
+POLARITY = {"vneg": 0, "neg": 0, "pos": 4, "vpos": 4}
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Exactitud y rendimiento de --engine vs eager")
+    p.add_argument("--corpus", required=True, help="jsonl de export_sentiment140.py (con label)")
+    p.add_argument("--n", type=int, default=1000)
+    p.add_argument("--engines", default="eager,int8-dynamic,torchscript")
+    p.add_argument("--model", default="tabularisai/multilingual-sentiment-analysis")
+    p.add_argument("--max-length", type=int, default=256)
+    p.add_argument("--batch-size", type=int, default=32)
+    p.add_argument("--threads", type=int, default=0, help="torch.set_num_threads; 0 = default")
+    return p.parse_args()
+
+
+def run_engine(engine: str, docs, tok, args) -> dict:
+    # modelo fresco por engine: torchscript/int8 no deben alterar el eager de referencia
+    mdl = AutoModelForSequenceClassification.from_pretrained(args.model)
+    mdl.eval()
+    id2label = mdl.config.id2label
+    mdl = build_engine(mdl, tok, engine, args.max_length)
+    infer_batch(mdl, encode_batch(tok, docs[: args.batch_size], args.max_length), id2label)
+
+    lat = LatencyWindow(size=100000)
+    preds = {}
+    t0 = time.perf_counter()
+    for i in range(0, len(docs), args.batch_size):
+        b0 = time.perf_counter()
+        for d, label, score in infer_batch(mdl, encode_batch(tok, docs[i:i + args.batch_size], args.max_length), id2label):
+            preds[d["_id"]] = (label, score)
+        lat.add((time.perf_counter() - b0) * 1000.0)
+    wall = time.perf_counter() - t0
+    return {"preds": preds, "secs": wall, "lat": lat}
+
+
+def main():
+    args = parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    docs = load_corpus(args.corpus, args.n)
+    if not docs:
+        print("corpus vacio", file=sys.stderr)
+        return 2
+    gold = {d["_id"]: d.get("label") for d in docs}
+
+    tok = AutoTokenizer.from_pretrained(args.model)
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+    if "eager" not in engines:
+        engines.insert(0, "eager")
+
+    ref = None
+    for engine in engines:
+        run = run_engine(engine, docs, tok, args)
+        preds = run["preds"]
+        ref = ref or preds
+        same = sum(1 for k, (label, _s) in preds.items() if ref[k][0] == label)
+        drift = [abs(score - ref[k][1]) for k, (_l, score) in preds.items()]
+        polar = [(POLARITY[label], gold[k]) for k, (label, _s) in preds.items() if label in POLARITY and gold[k] in (0, 4)]
+        res = {
+            "engine": engine,
+            "docs": len(preds),
+            "label_agreement": round(same / len(preds), 4),
+            "score_drift_mean": round(sum(drift) / len(drift), 5),
+            "score_drift_max": round(max(drift), 5),
+            "polarity_acc": round(sum(1 for p, g in polar if p == g) / len(polar), 4) if polar else None,
+            "docs_per_sec": round(len(preds) / run["secs"], 1),
+            "batch_p50_ms": round(run["lat"].pct(50), 1),
+            "batch_p95_ms": round(run["lat"].pct(95), 1),
+        }
+        print(json.dumps(res), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark de escalamiento: docs/seg vs numero de procesos de inferencia (--workers).
+
+Usa los mismos procesos que sentiment_dl_worker.py --workers N (modelo cargado una
+vez, fork copy-on-write, torch.set_num_threads = nucleos / N) sobre un corpus local,
+sin Mongo ni MySQL, para aislar el costo de inferencia en el host.
+
+USO
+  python scripts/bench_workers.py --corpus corpus.txt --n 4000 --workers 1,2,4 --batch-size 32
+
+Requisitos:
+  pip install torch transformers
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+import types
+
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+from bench_batching import load_corpus
+from sentiment_dl_worker import inference_proc
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Escalamiento de --workers en el host")
+    p.add_argument("--corpus", required=True, help="salida de export_sentiment140.py (txt o jsonl)")
+    p.add_argument("--n", type=int, default=4000, help="documentos por corrida")
+    p.add_argument("--workers", default="1,2,4", help="lista de N a probar, separada por comas")
+    p.add_argument("--threads-per-worker", type=int, default=0, help="0 = nucleos / N")
+    p.add_argument("--model", default="tabularisai/multilingual-sentiment-analysis")
+    p.add_argument("--max-length", type=int, default=256)
+    p.add_argument("--batch-size", type=int, default=32)
+    p.add_argument("--bucketing", action="store_true")
+    p.add_argument("--max-tokens", type=int, default=0)
+    return p.parse_args()
+
+
+def run_n(n_workers: int, texts, tok, mdl, id2label, args) -> dict:
+    ctx = mp.get_context("fork")
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // n_workers)
+    wargs = types.SimpleNamespace(max_length=args.max_length, bucketing=args.bucketing, max_tokens=args.max_tokens)
+    q_task = ctx.Queue()
+    q_res = ctx.Queue()
+    procs = [
+        ctx.Process(target=inference_proc, args=(r, threads, tok, mdl, id2label, wargs, q_task, q_res), daemon=True)
+        for r in range(n_workers)
+    ]
+    for pr in procs:
+        pr.start()
+    # calentamiento: un lote por proceso
+    for r in range(n_workers):
+        q_task.put((-1 - r, texts[: args.batch_size]))
+    for _ in range(n_workers):
+        q_res.get()
+
+    batches = [texts[i:i + args.batch_size] for i in range(0, len(texts), args.batch_size)]
+    t0 = time.perf_counter()
+    for bid, b in enumerate(batches):
+        q_task.put((bid, b))
+    done = 0
+    for _ in batches:
+        _bid, preds, err, _real, _total = q_res.get()
+        if err:
+            print(f"ERROR: {err}", file=sys.stderr)
+        done += len(preds or [])
+    wall = time.perf_counter() - t0
+    for _ in procs:
+        q_task.put(None)
+    for pr in procs:
+        pr.join()
+    return {"workers": n_workers, "threads_per_worker": threads, "docs": done,
+            "secs": round(wall, 3), "docs_per_sec": round(done / wall, 1)}
+
+
+def main():
+    args = parse_args()
+    texts = [d["comment"] for d in load_corpus(args.corpus, args.n)]
+    if not texts:
+        print("corpus vacio", file=sys.stderr)
+        return 2
+
+    tok = AutoTokenizer.from_pretrained(args.model)
+    mdl = AutoModelForSequenceClassification.from_pretrained(args.model)
+    mdl.eval()
+    id2label = mdl.config.id2label
+
+    base = None
+    for n in [int(x) for x in args.workers.split(",") if x.strip()]:
+        res = run_n(n, texts, tok, mdl, id2label, args)
+        base = base or res["docs_per_sec"]
+        res["speedup"] = round(res["docs_per_sec"] / base, 2)
+        print(json.dumps(res), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
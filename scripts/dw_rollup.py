@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Rollup diario de dw_messages para los dashboards de Metabase.
+
+dw_sentiment_daily (day, sentiment_label) -> n, score_sum.
+
+sentiment_dl_worker.py la mantiene en la MISMA transaccion que los INSERT del lote:
+lee por PK el aporte de los ids del lote antes (read_contrib) y despues de escribir, y
+suma la diferencia (apply_rollup). Con --upsert una fila reprocesada resta su aporte
+viejo y suma el nuevo; una fila que no se escribio (duplicado sin --upsert, error)
+aporta lo mismo antes y despues, asi nada cuenta doble.
+
+Este script reconstruye el rollup desde dw_messages (todo o desde una fecha), p.ej.
+tras crear la tabla sobre datos existentes o si se escribio dw_messages por fuera
+del worker. El INSERT ... SELECT corre en una transaccion: en REPEATABLE READ toma
+locks compartidos sobre las filas leidas, y los lotes concurrentes del worker esperan.
+
+USO
+  python scripts/dw_rollup.py --mysql-host 127.0.0.1 --mysql-user root --mysql-pass pass --mysql-db lab
+  python scripts/dw_rollup.py ... --since 2025-01-01
+
+Consultas de dashboard (tiempo constante respecto del tamano de dw_messages):
+  SELECT sentiment_label, SUM(n) FROM dw_sentiment_daily GROUP BY sentiment_label;
+  SELECT day, sentiment_label, n FROM dw_sentiment_daily ORDER BY day;
+
+Requisitos:
+  pip install mysql-connector-python
+"""
+
+import argparse
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+ROLLUP_TABLE = "dw_sentiment_daily"
+
+ROLLUP_DDL = f"""
+CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+  day              DATE         NOT NULL,
+  sentiment_label  ENUM('vneg','neg','neu','pos','vpos') NOT NULL,
+  n                BIGINT       NOT NULL DEFAULT 0,
+  score_sum        DOUBLE       NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, sentiment_label)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+UPSERT_SQL = (
+    f"INSERT INTO {ROLLUP_TABLE} (day, sentiment_label, n, score_sum) VALUES (%s, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE n = n + VALUES(n), score_sum = score_sum + VALUES(score_sum)"
+)
+
+Contrib = Dict[Tuple[object, str], List[float]]  # (day, label) -> [n, score_sum]
+
+
+def ensure_rollup_table(conn) -> None:
+    cur = conn.cursor()
+    try:
+        cur.execute(ROLLUP_DDL)
+    finally:
+        cur.close()
+
+
+def read_contrib(cur, ids: List[str]) -> Contrib:
+    """Aporte actual de esas filas de dw_messages al rollup (por dia y etiqueta)."""
+    out: Contrib = defaultdict(lambda: [0, 0.0])
+    if not ids:
+        return out
+    sql = ("SELECT DATE(ingest_ts), sentiment_label, COUNT(*), COALESCE(SUM(sentiment_score), 0) "
+           f"FROM dw_messages WHERE id IN ({', '.join(['%s'] * len(ids))}) GROUP BY 1, 2")
+    cur.execute(sql, ids)
+    for day, label, n, s in cur.fetchall():
+        out[(day, label)][0] += int(n)
+        out[(day, label)][1] += float(s)
+    return out
+
+
+def apply_rollup(cur, ids: List[str], before: Optional[Contrib] = None) -> None:
+    """
+    Suma al rollup el aporte actual de 'ids' menos 'before' (el leido antes de escribir,
+    en la misma transaccion). Un INSERT multi-fila con ON DUPLICATE KEY UPDATE.
+    """
+    delta = read_contrib(cur, ids)
+    for key, (n, s) in (before or {}).items():
+        delta[key][0] -= n
+        delta[key][1] -= s
+    rows = [(day, label, n, s) for (day, label), (n, s) in delta.items() if n or s]
+    # orden fijo por (day, label): workers concurrentes bloquean las filas calientes en el
+    # mismo orden y no se producen deadlocks entre ellos
+    rows.sort(key=lambda r: (str(r[0]), str(r[1])))
+    if rows:
+        cur.executemany(UPSERT_SQL, rows)
+
+
+def rebuild_rollup(conn, since: Optional[str] = None) -> int:
+    """Recalcula el rollup (desde 'since' si se indica) en una transaccion. Devuelve filas escritas."""
+    where = "WHERE ingest_ts >= %s" if since else ""
+    params = (since,) if since else ()
+    cur = conn.cursor()
+    try:
+        conn.start_transaction()
+        cur.execute(f"DELETE FROM {ROLLUP_TABLE}" + (" WHERE day >= %s" if since else ""), params)
+        cur.execute(
+            f"INSERT INTO {ROLLUP_TABLE} (day, sentiment_label, n, score_sum) "
+            "SELECT DATE(ingest_ts), sentiment_label, COUNT(*), SUM(sentiment_score) "
+            f"FROM dw_messages {where} GROUP BY 1, 2",
+            params,
+        )
+        written = cur.rowcount
+        conn.commit()
+        return written
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Reconstruye dw_sentiment_daily desde dw_messages")
+    p.add_argument("--mysql-host", required=True)
+    p.add_argument("--mysql-port", type=int, default=3306)
+    p.add_argument("--mysql-user", required=True)
+    p.add_argument("--mysql-pass", required=True)
+    p.add_argument("--mysql-db", required=True)
+    p.add_argument("--since", default=None, help="YYYY-MM-DD: solo reconstruye desde ese dia")
+    return p.parse_args()
+
+
+def main():
+    a = parse_args()
+    import mysql.connector
+    conn = mysql.connector.connect(host=a.mysql_host, port=a.mysql_port, user=a.mysql_user,
+                                   password=a.mysql_pass, database=a.mysql_db, autocommit=True)
+    ensure_rollup_table(conn)
+    t0 = time.perf_counter()
+    rows = rebuild_rollup(conn, a.since)
+    print(f"{ROLLUP_TABLE}: {rows} filas (dia x etiqueta) en {time.perf_counter() - t0:.2f} s", flush=True)
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
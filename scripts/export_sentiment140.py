@@ -1,15 +1,32 @@
 #!/usr/bin/env python3
 """
-Exporta el dataset Sentiment140 (Hugging Face) a TXT o JSONL.
+Exporta el dataset Sentiment140 (Hugging Face) a TXT, JSONL, Parquet o Arrow IPC.
 
 USO
   python -m pip install datasets
   python scripts/export_sentiment140.py --out corpus.txt --fmt txt --max 50000 --shuffle
   python scripts/export_sentiment140.py --out corpus.jsonl --fmt jsonl --max 50000 --shuffle
+  # streaming con memoria acotada (record batches de Arrow, escritura incremental)
+  python scripts/export_sentiment140.py --out corpus.jsonl --fmt jsonl --stream --shuffle --shuffle-buffer 100000
+
+  # 4 shards Arrow IPC escritos en paralelo (send_kafka_burst.py los memory-mapea)
+  python scripts/export_sentiment140.py --out corpus/shard.arrow --fmt arrow --shards 4 --shuffle
 
 SALIDA
-  - txt   : una linea por tweet (solo texto)
-  - jsonl : {"text": "...", "label": 0|4} por linea
+  - txt     : una linea por tweet (solo texto)
+  - jsonl   : {"text": "...", "label": 0|4} por linea
+  - parquet : columnas text (string), label (int64)
+  - arrow   : idem, Arrow IPC (formato file), apto para memory-map
+  - --shards N escribe <out>-000-of-00N.<ext> ... en N procesos; parquet, arrow y
+    --shards usan siempre el camino --stream
+
+MODO --stream
+  - Recorre la tabla Arrow (memory-mapped) en record batches; limpieza y filtro por
+    longitud vectorizados con pyarrow.compute; escribe cada lote al salir.
+  - --shuffle usa una permutacion de indices (take por bloques) o, con
+    --shuffle-buffer N, un buffer de barajado de N filas.
+  - --max corta la lectura en cuanto se escribieron N registros.
+  - Ambos modos reportan tiempo y RSS pico en stderr.
 
 NOTAS
   - Requiere permiso para ejecutar codigo remoto del dataset.
@@ -17,10 +34,13 @@ NOTAS
 """
 
 import argparse
+import os
 import sys
 import random
 import json
-from typing import List, Tuple
+import multiprocessing as mp
+import time
+from typing import Iterator, List, Tuple
 
 try:
     from datasets import load_dataset
@@ -31,13 +51,31 @@ except Exception as e:
 def parse_args():
     p = argparse.ArgumentParser(description="Exporta Sentiment140 a TXT o JSONL")
     p.add_argument("--out", required=True, help="ruta de salida (ej. corpus.txt o corpus.jsonl). usa '-' para stdout")
-    p.add_argument("--fmt", choices=["txt", "jsonl"], default="txt", help="formato de salida")
+    p.add_argument("--fmt", choices=["txt", "jsonl", "parquet", "arrow"], default="txt", help="formato de salida")
     p.add_argument("--max", type=int, default=0, help="maximo de registros; 0 = todos")
     p.add_argument("--shuffle", action="store_true", help="barajar antes de exportar")
     p.add_argument("--min-len", type=int, default=1, help="longitud minima del texto")
     p.add_argument("--seed", type=int, default=42, help="semilla aleatoria (para --shuffle)")
+    p.add_argument("--stream", action="store_true", help="exportar por record batches con memoria acotada")
+    p.add_argument("--batch-rows", type=int, default=50000, help="filas por record batch (--stream)")
+    p.add_argument("--shuffle-buffer", type=int, default=0,
+                   help="--stream --shuffle: tamano del buffer de barajado; 0 = permutacion de indices")
+    p.add_argument("--shards", type=int, default=1, help="archivos de salida escritos en paralelo")
     return p.parse_args()
 
+def peak_rss_mb(children: bool = False):
+    """RSS pico en MB (del proceso o del mayor de sus hijos); None donde no hay 'resource' (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss: KB en Linux, bytes en macOS
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+def rss_text(rss) -> str:
+    return "n/d" if rss is None else f"{rss:.0f}"
+
 def clean_text(s: str) -> str:
     # normaliza saltos de linea y espacios
     return s.replace("\r", " ").replace("\n", " ").strip()
@@ -65,6 +103,153 @@ def build_rows(items: List[dict], min_len: int) -> List[Tuple[str, int]]:
         rows.append((txt, label))
     return rows
 
+def load_sentiment140_table():
+    """
+    Tabla Arrow con todos los splits concatenados (sin copiar: los chunks siguen
+    memory-mapped desde el cache de datasets).
+    """
+    import pyarrow as pa
+    ds = load_dataset("stanfordnlp/sentiment140", trust_remote_code=True)
+    return pa.concat_tables([ds[split].data.table for split in ds.keys()])
+
+def clean_batch(batch, min_len: int) -> Tuple[List[str], List[int]]:
+    """
+    clean_text + filtro --min-len vectorizados sobre un record batch.
+    """
+    import pyarrow.compute as pc
+    txt = pc.utf8_trim_whitespace(pc.replace_substring_regex(batch.column("text"), pattern=r"[\r\n]", replacement=" "))
+    mask = pc.greater_equal(pc.utf8_length(txt), min_len)
+    if "sentiment" in batch.schema.names:
+        labels = pc.fill_null(pc.cast(batch.column("sentiment"), "int64", safe=False), -1)
+    else:
+        import pyarrow as pa
+        labels = pa.array([-1] * len(txt), pa.int64())
+    return pc.filter(txt, mask).to_pylist(), pc.filter(labels, mask).to_pylist()
+
+def stream_rows(table, args, shard: int = 0, shards: int = 1) -> Iterator[Tuple[List[str], List[int]]]:
+    """
+    Genera lotes (textos, labels) limpios en orden, por permutacion de indices o via
+    buffer de barajado, segun --shuffle/--shuffle-buffer. Con shards > 1 recorre solo
+    la porcion 'shard' (rango contiguo, o tramo de la misma permutacion).
+    """
+    if args.shuffle and not args.shuffle_buffer:
+        import numpy as np
+        import pyarrow as pa
+        perm = np.random.default_rng(args.seed).permutation(table.num_rows)
+        perm = np.array_split(perm, shards)[shard]
+        for i in range(0, len(perm), args.batch_rows):
+            yield clean_batch(table.take(pa.array(perm[i:i + args.batch_rows])), args.min_len)
+        return
+
+    lo, hi = table.num_rows * shard // shards, table.num_rows * (shard + 1) // shards
+    table = table.slice(lo, hi - lo)
+    batches = (clean_batch(b, args.min_len) for b in table.to_batches(max_chunksize=args.batch_rows))
+    if not args.shuffle:
+        yield from batches
+        return
+
+    # buffer de barajado: cada fila entrante reemplaza a una fila al azar que se emite
+    rng = random.Random(args.seed + shard)
+    buf: List[Tuple[str, int]] = []
+    for texts, labels in batches:
+        out_t, out_l = [], []
+        for row in zip(texts, labels):
+            if len(buf) < args.shuffle_buffer:
+                buf.append(row)
+                continue
+            j = rng.randrange(len(buf))
+            out_t.append(buf[j][0])
+            out_l.append(buf[j][1])
+            buf[j] = row
+        if out_t:
+            yield out_t, out_l
+    rng.shuffle(buf)
+    if buf:
+        yield [r[0] for r in buf], [r[1] for r in buf]
+
+def write_stream(path: str, fmt: str, batches, max_rows: int) -> int:
+    if fmt in ("parquet", "arrow"):
+        return write_stream_columnar(path, fmt, batches, max_rows)
+    out_fh = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+    n = 0
+    try:
+        for texts, labels in batches:
+            if max_rows:
+                texts, labels = texts[:max_rows - n], labels[:max_rows - n]
+            if fmt == "txt":
+                chunk = "\n".join(texts)
+            else:
+                chunk = "\n".join(json.dumps({"text": t, "label": l}, ensure_ascii=False) for t, l in zip(texts, labels))
+            if texts:
+                out_fh.write(chunk + "\n")
+            n += len(texts)
+            if max_rows and n >= max_rows:
+                break  # corta la lectura: el generador no pide mas lotes
+    finally:
+        if out_fh is not sys.stdout:
+            out_fh.close()
+    return n
+
+def write_stream_columnar(path: str, fmt: str, batches, max_rows: int) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([("text", pa.string()), ("label", pa.int64())])
+    writer = pq.ParquetWriter(path, schema) if fmt == "parquet" else pa.ipc.new_file(path, schema)
+    n = 0
+    try:
+        for texts, labels in batches:
+            if max_rows:
+                texts, labels = texts[:max_rows - n], labels[:max_rows - n]
+            if texts:
+                writer.write_table(pa.table({"text": texts, "label": labels}, schema=schema))
+            n += len(texts)
+            if max_rows and n >= max_rows:
+                break
+    finally:
+        writer.close()
+    return n
+
+def shard_path(path: str, i: int, n: int) -> str:
+    stem, ext = os.path.splitext(path)
+    return f"{stem}-{i:03d}-of-{n:03d}{ext}"
+
+def export_shard(args, i: int) -> int:
+    # cada proceso abre el mismo cache (memory-mapped) y escribe su porcion
+    quota = 0
+    if args.max:
+        quota = args.max // args.shards + (1 if i < args.max % args.shards else 0)
+        if not quota:
+            return 0
+    table = load_sentiment140_table()
+    return write_stream(shard_path(args.out, i, args.shards), args.fmt, stream_rows(table, args, i, args.shards), quota)
+
+def main_stream(args) -> int:
+    t0 = time.perf_counter()
+    if args.out == "-" and (args.shards > 1 or args.fmt in ("parquet", "arrow")):
+        print("ERROR: parquet/arrow/--shards requieren --out a archivo", file=sys.stderr)
+        return 2
+    try:
+        if args.shards > 1:
+            if os.path.dirname(args.out):
+                os.makedirs(os.path.dirname(args.out), exist_ok=True)
+            with mp.Pool(args.shards) as pool:  # contexto por defecto: spawn en Windows
+                n = sum(pool.starmap(export_shard, [(args, i) for i in range(args.shards)]))
+        else:
+            n = write_stream(args.out, args.fmt, stream_rows(load_sentiment140_table(), args), args.max)
+    except Exception as e:
+        print(f"ERROR exportando dataset: {e}", file=sys.stderr)
+        return 2
+    if not n:
+        print("Dataset sin registros tras filtros. Ajusta --min-len o verifica el dataset.", file=sys.stderr)
+        return 2
+    print(f"Escrito {n} registros en {args.out}", file=sys.stderr)
+    # con --shards el RSS pico es por proceso (RUSAGE_CHILDREN = el mayor de los hijos)
+    rss = peak_rss_mb()
+    if rss is not None and args.shards > 1:
+        rss = max(rss, peak_rss_mb(children=True))
+    print(f"modo=stream segs={time.perf_counter() - t0:.1f} rss_pico_mb={rss_text(rss)}", file=sys.stderr)
+    return 0
+
 def write_out(path: str, fmt: str, rows: List[Tuple[str, int]]) -> int:
     out_fh = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
     n = 0
@@ -84,6 +269,9 @@ def write_out(path: str, fmt: str, rows: List[Tuple[str, int]]) -> int:
 
 def main():
     args = parse_args()
+    if args.stream or args.shards > 1 or args.fmt in ("parquet", "arrow"):
+        return main_stream(args)
+    t0 = time.perf_counter()
     if args.shuffle:
         random.seed(args.seed)
 
@@ -105,6 +293,7 @@ def main():
 
     n = write_out(args.out, args.fmt, rows)
     print(f"Escrito {n} registros en {args.out}", file=sys.stderr)
+    print(f"modo=lista segs={time.perf_counter() - t0:.1f} rss_pico_mb={rss_text(peak_rss_mb())}", file=sys.stderr)
     return 0
 
 if __name__ == "__main__":
@@ -106,6 +106,15 @@ CREATE TABLE IF NOT EXISTS dw_messages (
   INDEX idx_ingest_ts (ingest_ts DESC)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Rollup diario para dashboards (lo mantiene el worker; reconstruir con scripts/dw_rollup.py)
+CREATE TABLE IF NOT EXISTS dw_sentiment_daily (
+  day              DATE         NOT NULL,
+  sentiment_label  ENUM('vneg','neg','neu','pos','vpos') NOT NULL,
+  n                BIGINT       NOT NULL DEFAULT 0,
+  score_sum        DOUBLE       NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, sentiment_label)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- Crear indice por tiempo si faltara (idempotente via SQL dinamico)
 SET @idx_exists := (
   SELECT COUNT(1) FROM information_schema.statistics
@@ -114,7 +123,7 @@ SET @idx_exists := (
 SET @sql := IF(@idx_exists=0, 'CREATE INDEX idx_ingest_ts ON dw_messages (ingest_ts DESC);', 'SELECT 1');
 PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
 SQL
-  ok "esquema MySQL verificado en DB=${MYSQL_DB} (tabla dw_messages)"
+  ok "esquema MySQL verificado en DB=${MYSQL_DB} (tablas dw_messages, dw_sentiment_daily)"
 else
   log "CREATE_MYSQL_SCHEMA=false (omitido)"
 fi
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Consultas del Lab1 (Electronics Store) sobre MongoDB, Redis y HBase.
+
+Las tres preguntas del notebook:
+  category  categoria mas vendida        (conteo por category_code)
+  brand     marca con mas ingresos       (suma de price por brand)
+  month     mes con mas ventas (UTC)     (conteo por event_time[:7])
+
+MongoDB: $group equivalente al del notebook (mongo_top).
+HBase  : table.scan() completo, como el notebook (hbase_scan_top); es la linea base.
+         HBaseScanner: solo las columnas necesarias, batch_size ajustable y el espacio
+         de row keys partido en rangos que se escanean en paralelo con un
+         happybase.ConnectionPool; los Counter parciales se suman al final.
+Redis, dos caminos:
+  - agg : sorted sets que lab1_loader.py mantiene al cargar (ZINCRBY en el mismo
+          pipeline que los HSET). La respuesta es un ZREVRANGE 0 0 -> O(log n).
+  - scan: SCAN purchase:* + HMGET en pipeline (un round trip por lote de claves,
+          no uno por clave y campo). Sirve para preguntas ad-hoc sin agregado previo.
+
+category_code/brand vacios no cuentan en ningun backend (asi lo hacen las
+consultas Redis/HBase del notebook), para que las respuestas sean comparables.
+bench_lab1_queries.py mide todos los caminos.
+
+USO (Redis)
+  python scripts/lab1_queries.py --mode agg
+  python scripts/lab1_queries.py --mode scan --scan-count 5000
+
+Requisitos:
+  pip install redis   (pymongo / happybase segun el backend)
+"""
+
+import argparse
+import json
+import queue
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterable, List, Optional, Tuple
+
+# Sorted sets mantenidos por lab1_loader.py (miembro -> score)
+AGG_KEYS = {
+    "category": "agg:category_count",
+    "brand": "agg:brand_revenue",
+    "month": "agg:month_sales",
+}
+QUESTIONS = tuple(AGG_KEYS)
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Consultas Lab1 sobre Redis (agregados o scan)")
+    p.add_argument("--mode", choices=["agg", "scan", "both"], default="both")
+    p.add_argument("--redis-host", default="localhost")
+    p.add_argument("--redis-port", type=int, default=6379)
+    p.add_argument("--redis-pass", default=None)
+    p.add_argument("--scan-count", type=int, default=5000, help="claves por SCAN y por pipeline de HMGET")
+    return p.parse_args(argv)
+
+
+def _s(v) -> str:
+    return v.decode() if isinstance(v, bytes) else ("" if v is None else str(v))
+
+
+# ---------- camino agg (sorted sets) ----------
+
+def redis_top(r, question: str, n: int = 1) -> List[Tuple[str, float]]:
+    """Top-n de una pregunta desde su sorted set."""
+    return [(_s(m), float(s)) for m, s in r.zrevrange(AGG_KEYS[question], 0, n - 1, withscores=True)]
+
+
+# ---------- camino scan (HMGET en pipeline) ----------
+
+def redis_scan(r, fields: List[str], count: int = 5000, match: str = "purchase:*") -> Iterable[List[str]]:
+    """
+    Recorre los hashes que cumplen 'match' y devuelve, por hash, los valores de 'fields'
+    (str, "" si falta). Un pipeline de HMGET por lote de 'count' claves.
+    """
+    keys = []
+    for key in r.scan_iter(match, count=count):
+        keys.append(key)
+        if len(keys) >= count:
+            yield from _hmget_many(r, keys, fields)
+            keys = []
+    if keys:
+        yield from _hmget_many(r, keys, fields)
+
+
+def _hmget_many(r, keys, fields):
+    pipe = r.pipeline(transaction=False)
+    for k in keys:
+        pipe.hmget(k, fields)
+    for vals in pipe.execute():
+        yield [_s(v) for v in vals]
+
+
+def redis_scan_agg(r, fields: List[str], key_fn: Callable[[List[str]], Optional[str]],
+                   value_fn: Callable[[List[str]], float] = lambda v: 1.0, count: int = 5000) -> Counter:
+    """Agregacion ad-hoc: Counter[key_fn(valores)] += value_fn(valores); key None se descarta."""
+    c = Counter()
+    for vals in redis_scan(r, fields, count):
+        k = key_fn(vals)
+        if k:
+            try:
+                c[k] += value_fn(vals)
+            except ValueError:
+                pass
+    return c
+
+
+SCAN_QUERIES = {
+    "category": (["category_code"], lambda v: v[0], lambda v: 1.0),
+    "brand": (["brand", "price"], lambda v: v[0], lambda v: float(v[1])),
+    "month": (["event_time"], lambda v: v[0][:7], lambda v: 1.0),
+}
+
+
+def redis_scan_top(r, question: str, n: int = 1, count: int = 5000) -> List[Tuple[str, float]]:
+    fields, key_fn, value_fn = SCAN_QUERIES[question]
+    return redis_scan_agg(r, fields, key_fn, value_fn, count).most_common(n)
+
+
+# ---------- MongoDB ----------
+
+MONGO_PIPELINES = {
+    "category": [{"$match": {"category_code": {"$ne": ""}}},
+                 {"$group": {"_id": "$category_code", "total": {"$sum": 1}}}],
+    "brand": [{"$match": {"brand": {"$ne": ""}}},
+              {"$group": {"_id": "$brand", "total": {"$sum": "$price"}}}],
+    "month": [{"$project": {"mes": {"$substr": ["$event_time", 0, 7]}}},
+              {"$group": {"_id": "$mes", "total": {"$sum": 1}}}],
+}
+
+
+def mongo_top(col, question: str, n: int = 1) -> List[Tuple[str, float]]:
+    pipe = MONGO_PIPELINES[question] + [{"$sort": {"total": -1}}, {"$limit": n}]
+    return [(_s(d["_id"]), float(d["total"])) for d in col.aggregate(pipe, allowDiskUse=True)]
+
+
+# ---------- HBase ----------
+
+HBASE_QUERIES = {
+    "category": (b"cf:category_code", None),
+    "brand": (b"cf:brand", b"cf:price"),
+    "month": (b"cf:event_time", None),
+}
+
+
+def hbase_count(counter: Counter, question: str, data: dict) -> None:
+    """Suma una fila de HBase al Counter de la pregunta (comun a todos los scans)."""
+    key_col, val_col = HBASE_QUERIES[question]
+    k = data.get(key_col)
+    if not k:
+        return
+    k = k.decode()
+    if question == "month":
+        k = k[:7]
+    if val_col is None:
+        counter[k] += 1
+        return
+    try:
+        counter[k] += float(data.get(val_col, b"").decode())
+    except ValueError:
+        pass
+
+
+def hbase_scan_top(table, question: str, n: int = 1) -> List[Tuple[str, float]]:
+    """Scan completo sin columns= ni batch_size, igual que el notebook."""
+    c = Counter()
+    for _key, data in table.scan():
+        hbase_count(c, question, data)
+    return c.most_common(n)
+
+
+def split_keys(lo: bytes, hi: bytes, n: int) -> List[bytes]:
+    """
+    n-1 limites entre lo y hi sin muestrear la tabla. Si ambas claves empiezan con un
+    numero del mismo ancho (row key '<order_id>-<fila>' de lab1_loader.py) se interpola
+    ese numero; si no, las claves completas como enteros big-endian.
+    """
+    ml, mh = re.match(rb"\d+", lo), re.match(rb"\d+", hi)
+    if ml and mh and len(ml.group()) == len(mh.group()):
+        width = len(ml.group())
+        a, b = int(ml.group()), int(mh.group())
+        pts = {str(a + (b - a) * i // n).zfill(width).encode() for i in range(1, n)}
+    else:
+        size = max(len(lo), len(hi))
+        a = int.from_bytes(lo.ljust(size, b"\0"), "big")
+        b = int.from_bytes(hi.ljust(size, b"\0"), "big")
+        pts = {(a + (b - a) * i // n).to_bytes(size, "big") for i in range(1, n)}
+    return [p for p in sorted(pts) if lo < p <= hi]
+
+
+class HBaseScanner:
+    """
+    Agregaciones por scan en paralelo. 'table_ctx' es un callable que devuelve un
+    context manager con una happybase.Table (ver connect()); cada hilo toma la suya.
+    """
+
+    def __init__(self, table_ctx, workers: int = 4, ranges: int = 0, batch_size: int = 5000):
+        self.table_ctx = table_ctx
+        self.workers = workers
+        self.ranges = ranges or workers * 4  # mas rangos que hilos: reparte mejor
+        self.batch_size = batch_size
+        self.pool = None  # happybase.ConnectionPool si se creo con connect()
+
+    @classmethod
+    def connect(cls, host: str, port: int, table: str, workers: int = 4, **kw) -> "HBaseScanner":
+        import happybase
+        pool = happybase.ConnectionPool(size=workers, host=host, port=port)
+
+        @contextmanager
+        def table_ctx():
+            with pool.connection() as conn:
+                yield conn.table(table)
+
+        sc = cls(table_ctx, workers, **kw)
+        sc.pool = pool
+        return sc
+
+    def close(self) -> None:
+        """Cierra las conexiones del pool de connect(); sin pool no hace nada."""
+        if self.pool is None:
+            return
+        # happybase.ConnectionPool no expone close(): se vacia su cola de conexiones
+        while True:
+            try:
+                conn = self.pool._queue.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+        self.pool = None
+
+    def key_ranges(self) -> List[Tuple[Optional[bytes], Optional[bytes]]]:
+        """
+        [(row_start, row_stop)]; el primero y el ultimo quedan abiertos, asi que cubren
+        toda la tabla. Con varias regiones se usan sus limites; si no, interpolacion
+        entre la primera y la ultima clave.
+        """
+        with self.table_ctx() as t:
+            regions = t.regions() if hasattr(t, "regions") else []
+            if len(regions) > 1:
+                bounds = [r["start_key"] for r in regions[1:]]
+            else:
+                first = next(t.scan(limit=1, filter=b"KeyOnlyFilter()"), None)
+                last = next(t.scan(limit=1, reverse=True, filter=b"KeyOnlyFilter()"), None)
+                if first is None:
+                    return []
+                bounds = split_keys(first[0], last[0], self.ranges)
+        edges = [None] + bounds + [None]
+        return list(zip(edges, edges[1:]))
+
+    def _scan_range(self, question: str, start, stop) -> Counter:
+        key_col, val_col = HBASE_QUERIES[question]
+        cols = [key_col] + ([val_col] if val_col else [])
+        c = Counter()
+        with self.table_ctx() as t:
+            for _key, data in t.scan(row_start=start, row_stop=stop, columns=cols, batch_size=self.batch_size):
+                hbase_count(c, question, data)
+        return c
+
+    def counter(self, question: str) -> Counter:
+        total = Counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as ex:
+            for part in ex.map(lambda r: self._scan_range(question, *r), self.key_ranges()):
+                total.update(part)
+        return total
+
+    def top(self, question: str, n: int = 1) -> List[Tuple[str, float]]:
+        return self.counter(question).most_common(n)
+
+
+def main(argv=None):
+    a = parse_args(argv)
+    import redis
+    r = redis.Redis(host=a.redis_host, port=a.redis_port, password=a.redis_pass)
+    modes = ["agg", "scan"] if a.mode == "both" else [a.mode]
+    for mode in modes:
+        for q in QUESTIONS:
+            t0 = time.perf_counter()
+            top = redis_top(r, q) if mode == "agg" else redis_scan_top(r, q, count=a.scan_count)
+            ms = (time.perf_counter() - t0) * 1000.0
+            print(json.dumps({"mode": mode, "question": q, "top": top[0] if top else None,
+                              "ms": round(ms, 3)}), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
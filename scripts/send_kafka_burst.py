@@ -12,20 +12,50 @@ NOTA
     - Linux/macOS: .venv/bin/
   o ejecutarlo desde scripts/ con Python del venv activo.
 
+MODO OPEN-LOOP (--rate / --schedule / --ramp)
+  Cada cliente envia en instantes planificados (token bucket a rate/clients), sin
+  esperar a que el envio anterior termine. La latencia se mide desde el instante
+  PLANIFICADO hasta el ack del broker, asi un broker lento no reduce la carga
+  ofrecida ni esconde su propia demora (coordinated omission). Al final cada
+  cliente reporta por escalon: rate objetivo vs logrado y percentiles de latencia.
+
+MODO MAX-THROUGHPUT (--max-throughput)
+  Sin esperas ni flush periodico. Los comentarios se pre-codifican a bytes JSON una
+  vez; por mensaje solo se empalman user_id, id (prefijo del cliente + contador) y
+  ts (ISO cacheado por milisegundo). batch_size/linger_ms/acks/compresion son
+  configurables. Reporta msgs/seg y MB/seg por cliente y agregados.
+
+CORPUS ARROW (--text-file)
+  Ademas de .txt, --text-file acepta un archivo .arrow o un directorio con shards
+  .arrow (export_sentiment140.py --fmt arrow --shards N). Cada cliente memory-mapea
+  SU shard (cliente i -> shard (i-1) mod N) dentro de su proceso, en lugar de que el
+  padre lea todo el corpus a una lista que se copia a cada cliente: el arranque y la
+  memoria por proceso no crecen con el tamano del corpus.
+
 USO
   python -m pip install kafka-python
   python scripts/send_kafka_burst.py --bootstrap 51.57.73.26:29092 --topic user-topic \
     --clients 1 --max 10 --min-delay 0.5 --max-delay 3.0
+  # 4 clientes, 100 -> 5000 msg/s agregados en escalones de 700 cada 20 s
+  python scripts/send_kafka_burst.py --bootstrap 51.57.73.26:29092 --topic user-topic \
+    --clients 4 --ramp 100:5000:700:20
+  # estres: 4 clientes a tope 60 s, lotes de 256 KB, lz4
+  python scripts/send_kafka_burst.py --bootstrap 51.57.73.26:29092 --topic user-topic \
+    --clients 4 --duration 60 --max-throughput --batch-size 262144 --linger-ms 20 --compression lz4
 """
 
 import argparse
+import glob
 import json
+import math
+import os
+import queue
 import random
 import time
 import uuid
 import sys
 from datetime import datetime, timezone
-from multiprocessing import Process
+from multiprocessing import Process, Queue
 
 try:
     from kafka import KafkaProducer
@@ -53,12 +83,94 @@ def parse_args():
     p.add_argument("--duration", type=int, default=0, help="segundos totales por cliente; 0 = sin limite")
     p.add_argument("--min-delay", type=float, default=0.5, help="min espera entre mensajes (s)")
     p.add_argument("--max-delay", type=float, default=3.0, help="max espera entre mensajes (s)")
-    p.add_argument("--text-file", default=None, help="archivo .txt con frases (una por linea)")
+    p.add_argument("--text-file", default=None,
+                   help="archivo .txt con frases (una por linea), archivo .arrow o directorio de shards .arrow")
+    # Open-loop
+    p.add_argument("--rate", type=float, default=0, help="msgs/seg AGREGADOS entre todos los clientes; 0 = closed-loop")
+    p.add_argument("--schedule", default=None, help="escalones 'rate:segs,rate:segs,...' (msgs/seg agregados)")
+    p.add_argument("--ramp", default=None, help="'desde:hasta:paso:segs', ej 100:5000:500:30")
+    # Max-throughput
+    p.add_argument("--max-throughput", action="store_true", help="envio a tope con payload pre-codificado")
+    p.add_argument("--batch-size", type=int, default=16384, help="batch_size del productor (bytes)")
+    p.add_argument("--linger-ms", type=int, default=10, help="linger_ms del productor")
+    p.add_argument("--acks", choices=["0", "1", "all"], default="1")
+    p.add_argument("--compression", choices=["none", "gzip", "snappy", "lz4", "zstd"], default="none")
+    p.add_argument("--report-every", type=float, default=5.0, help="segundos entre metricas (--max-throughput)")
     return p.parse_args()
 
+def parse_schedule(args):
+    """
+    Devuelve [(rate_agregado, segs)] o [] para el modo closed-loop original.
+    """
+    if args.ramp:
+        try:
+            lo, hi, step, secs = (float(x) for x in args.ramp.split(":"))
+        except ValueError:
+            raise SystemExit(f"--ramp invalido '{args.ramp}': se espera desde:hasta:paso:segs")
+        if step <= 0:
+            raise SystemExit(f"--ramp: el paso debe ser > 0 (recibido {step:g})")
+        if lo <= 0 or hi <= 0 or secs <= 0:
+            raise SystemExit("--ramp: desde, hasta y segs deben ser > 0")
+        out, r = [], lo
+        while r < hi:
+            out.append((r, secs))
+            r += step
+        out.append((hi, secs))
+        return out
+    if args.schedule:
+        out = []
+        for part in (x for x in args.schedule.split(",") if x.strip()):
+            try:
+                r, t = (float(v) for v in part.split(":"))
+            except ValueError:
+                raise SystemExit(f"--schedule: escalon invalido '{part}', se espera tasa:segs")
+            if r <= 0 or t <= 0:
+                raise SystemExit(f"--schedule: tasa y segs deben ser > 0 (escalon '{part}')")
+            out.append((r, t))
+        return out
+    if args.rate > 0:
+        return [(args.rate, float(args.duration) if args.duration else math.inf)]
+    return []
+
+def pct(data, q: float) -> float:
+    data = sorted(data)
+    return data[min(len(data) - 1, int(q / 100.0 * len(data)))] if data else 0.0
+
+def arrow_shards(path):
+    if path and os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "*.arrow")))
+    if path and path.endswith(".arrow"):
+        return [path]
+    return []
+
+class ArrowTexts:
+    """
+    Secuencia de textos sobre la columna 'text' de un archivo Arrow IPC memory-mapped:
+    las paginas se leen bajo demanda y se comparten via page cache entre procesos.
+    """
+    def __init__(self, path: str):
+        import pyarrow as pa
+        self.col = pa.ipc.open_file(pa.memory_map(path, "r")).read_all().column("text")
+
+    def __len__(self):
+        return len(self.col)
+
+    def __getitem__(self, i):
+        return self.col[i].as_py() or ""
+
+def client_texts(idx: int, args, texts):
+    # corre dentro del proceso cliente: abre su shard Arrow si --text-file lo indica
+    shards = arrow_shards(args.text_file)
+    if not shards:
+        return texts
+    t = ArrowTexts(shards[(idx - 1) % len(shards)])
+    return t if len(t) else DEFAULT_CORPUS
+
 def load_texts(path):
     if not path:
         return DEFAULT_CORPUS
+    if arrow_shards(path):
+        return None  # cada cliente mapea su shard en client_texts()
     try:
         with open(path, "r", encoding="utf-8") as f:
             lines = [ln.strip() for ln in f if ln.strip()]
@@ -75,8 +187,20 @@ def build_producer(bootstrap: str) -> KafkaProducer:
         key_serializer=lambda v: v.encode("utf-8") if v is not None else None,
     )
 
+def build_payload(client_id: str, texts):
+    return {
+        "user_id": f"user_{random.randint(1, 100000):05d}",
+        "comment": random.choice(texts),
+        "meta": {
+            "id": str(uuid.uuid4()),
+            "client_id": client_id,
+            "ts": datetime.now(timezone.utc).isoformat()
+        }
+    }
+
 def run_client(idx: int, args, texts):
     client_id = f"py-{idx:03d}"
+    texts = client_texts(idx, args, texts)
     prod = build_producer(args.bootstrap)
     sent = 0
     start = time.time()
@@ -87,21 +211,8 @@ def run_client(idx: int, args, texts):
             if args.duration and (time.time() - start) >= args.duration:
                 break
 
-            msg_id = str(uuid.uuid4())
-            user_id = f"user_{random.randint(1, 100000):05d}"
-            comment = random.choice(texts)
-            now = datetime.now(timezone.utc).isoformat()
-
             # Formato requerido + metadatos
-            payload = {
-                "user_id": user_id,
-                "comment": comment,
-                "meta": {
-                    "id": msg_id,
-                    "client_id": client_id,
-                    "ts": now
-                }
-            }
+            payload = build_payload(client_id, texts)
 
             prod.send(args.topic, key=client_id, value=payload)
             sent += 1
@@ -117,15 +228,192 @@ def run_client(idx: int, args, texts):
         prod.close()
         print(f"done client={client_id} sent={sent}", flush=True)
 
+def build_fast_producer(args) -> KafkaProducer:
+    # value/key llegan ya como bytes: sin serializer por mensaje
+    return KafkaProducer(
+        bootstrap_servers=args.bootstrap,
+        acks=args.acks if args.acks == "all" else int(args.acks),
+        linger_ms=args.linger_ms,
+        batch_size=args.batch_size,
+        compression_type=None if args.compression == "none" else args.compression,
+    )
+
+def run_client_fast(idx: int, args, texts, q_out):
+    """
+    Max-throughput: comentarios pre-codificados, id = prefijo del cliente + contador
+    y ts recalculado solo cuando cambia el milisegundo. Sin flush periodico.
+    """
+    client_id = f"py-{idx:03d}"
+    sent = 0
+    nbytes = 0
+    start = time.time()
+    prod = None
+    try:
+        texts = client_texts(idx, args, texts)
+        prod = build_fast_producer(args)
+        sent, nbytes = _send_fast(client_id, args, texts, prod)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"error client={client_id}: {e}", file=sys.stderr, flush=True)
+    finally:
+        # el padre espera un reporte por cliente: se envia aunque el flush o el arranque fallen
+        try:
+            if prod is not None:
+                prod.flush()
+                prod.close()
+        except Exception as e:
+            print(f"error client={client_id} al cerrar: {e}", file=sys.stderr, flush=True)
+        secs = max(time.time() - start, 1e-9)
+        print(f"done client={client_id} sent={sent} rate={sent / secs:.0f}/s mb_s={nbytes / secs / 1e6:.2f}", flush=True)
+        q_out.put((sent, nbytes, secs))
+
+def _send_fast(client_id: str, args, texts, prod):
+    """Loop de envio de run_client_fast; devuelve (enviados, bytes). Ctrl-C o un error cortan el loop."""
+    key = client_id.encode("utf-8")
+    id_prefix = f"{client_id}-{uuid.uuid4().hex[:8]}-"
+    tail = f'","client_id":"{client_id}","ts":"'.encode("utf-8")
+    rnd = random.Random(os.getpid())
+    if isinstance(texts, list):
+        comments = [json.dumps(t, ensure_ascii=False).encode("utf-8") for t in texts]
+        pick = lambda: comments[rnd.randrange(len(comments))]
+    else:
+        # shard Arrow: se codifica al vuelo para no materializar el corpus en el proceso
+        pick = lambda: json.dumps(texts[rnd.randrange(len(texts))], ensure_ascii=False).encode("utf-8")
+    sent = 0
+    nbytes = 0
+    last_ms = -1
+    ts = b""
+    start = last_report = time.time()
+    last_sent = last_bytes = 0
+    try:
+        while True:
+            if args.max and sent >= args.max:
+                break
+            now = time.time()
+            if args.duration and (now - start) >= args.duration:
+                break
+            ms = int(now * 1000)
+            if ms != last_ms:
+                last_ms = ms
+                ts = datetime.fromtimestamp(now, timezone.utc).isoformat(timespec="milliseconds").encode("ascii")
+            value = b"".join((
+                b'{"user_id":"user_%05d","comment":' % rnd.randint(1, 100000),
+                pick(),
+                b',"meta":{"id":"', (id_prefix + str(sent)).encode("ascii"), tail, ts, b'"}}',
+            ))
+            prod.send(args.topic, key=key, value=value)
+            sent += 1
+            nbytes += len(value)
+            if now - last_report >= args.report_every:
+                dt = now - last_report
+                print(f"metric client={client_id} sent={sent} rate={(sent - last_sent) / dt:.0f}/s "
+                      f"mb_s={(nbytes - last_bytes) / dt / 1e6:.2f}", flush=True)
+                last_report, last_sent, last_bytes = now, sent, nbytes
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:  # p.ej. KafkaTimeoutError con el broker caido: se reporta lo enviado
+        print(f"error client={client_id}: {e}", file=sys.stderr, flush=True)
+    return sent, nbytes
+
+def run_client_open(idx: int, args, texts, schedule):
+    """
+    Open-loop: el mensaje k de un escalon se planifica en t0 + k / rate_cliente.
+    Si el cliente se atrasa (send bloqueado), envia de inmediato para ponerse al dia;
+    la latencia 'corr' (ack - planificado) absorbe ese atraso, 'svc' (ack - envio) no.
+    """
+    client_id = f"py-{idx:03d}"
+    texts = client_texts(idx, args, texts)
+    prod = build_producer(args.bootstrap)
+    n_clients = max(1, args.clients)
+    steps = []
+    sent = 0
+    try:
+        for rate_total, secs in schedule:
+            rate = rate_total / n_clients
+            st = {"target": rate_total, "sent": 0, "errors": 0, "corr": [], "svc": [], "t0": time.perf_counter()}
+            steps.append(st)
+
+            def _ack(intended, sent_at, _md, st=st):
+                now = time.perf_counter()
+                st["corr"].append((now - intended) * 1000.0)
+                st["svc"].append((now - sent_at) * 1000.0)
+
+            def _err(_exc, st=st):
+                st["errors"] += 1
+
+            t0 = st["t0"]
+            t_end = t0 + secs
+            t_next = t0
+            while t_next < t_end:
+                if args.max and sent >= args.max:
+                    break
+                now = time.perf_counter()
+                if t_next > now:
+                    time.sleep(t_next - now)
+                fut = prod.send(args.topic, key=client_id, value=build_payload(client_id, texts))
+                fut.add_callback(_ack, t_next, time.perf_counter())
+                fut.add_errback(_err)
+                st["sent"] += 1
+                sent += 1
+                t_next += 1.0 / rate
+            st["secs"] = max(time.perf_counter() - t0, 1e-9)
+            print(f"metric client={client_id} target={rate_total:.0f}/s "
+                  f"achieved={st['sent'] * n_clients / st['secs']:.0f}/s (x{n_clients} clientes)", flush=True)
+            if args.max and sent >= args.max:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        prod.flush()
+        prod.close()
+        for i, st in enumerate(steps):
+            # un escalon cortado por Ctrl-C no llego a fijar 'secs': se mide hasta ahora
+            secs = st.get("secs") or max(time.perf_counter() - st["t0"], 1e-9)
+            print(json.dumps({
+                "client": client_id, "step": i, "target_rate": st["target"] / n_clients,
+                "achieved_rate": round(st["sent"] / secs, 1), "sent": st["sent"], "errors": st["errors"],
+                "lat_ms_p50": round(pct(st["corr"], 50), 2), "lat_ms_p95": round(pct(st["corr"], 95), 2),
+                "lat_ms_p99": round(pct(st["corr"], 99), 2), "lat_ms_max": round(max(st["corr"] or [0]), 2),
+                "svc_ms_p50": round(pct(st["svc"], 50), 2), "svc_ms_p99": round(pct(st["svc"], 99), 2),
+            }), flush=True)
+        print(f"done client={client_id} sent={sent}", flush=True)
+
 def main():
     args = parse_args()
     texts = load_texts(args.text_file)
+    schedule = parse_schedule(args)
+    q_out = Queue()
+    if args.max_throughput:
+        target, extra = run_client_fast, (q_out,)
+    elif schedule:
+        target, extra = run_client_open, (schedule,)
+    else:
+        target, extra = run_client, ()
     procs = []
     for i in range(1, max(1, args.clients) + 1):
-        p = Process(target=run_client, args=(i, args, texts), daemon=False)
+        p = Process(target=target, args=(i, args, texts) + extra, daemon=False)
         p.start()
         procs.append(p)
         print(f"started client {i} pid={p.pid}")
+    if args.max_throughput:
+        res = []
+        interrupted = False
+        while len(res) < len(procs):
+            try:
+                res.append(q_out.get(timeout=1.0))
+            except queue.Empty:
+                if not any(p.is_alive() for p in procs):
+                    break  # algun cliente murio sin reportar; sus reportes ya encolados se tomaron
+            except KeyboardInterrupt:
+                if interrupted:
+                    raise  # segundo Ctrl-C: salir sin esperar a los clientes
+                interrupted = True  # el primero: los clientes tambien lo reciben y reportan al cerrar
+        if res:
+            secs = max(r[2] for r in res)
+            sent = sum(r[0] for r in res)
+            print(f"aggregate clients={len(res)}/{len(procs)} sent={sent} rate={sent / secs:.0f}/s "
+                  f"mb_s={sum(r[1] for r in res) / secs / 1e6:.2f}", flush=True)
     for p in procs:
         p.join()
 
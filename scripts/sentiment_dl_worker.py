@@ -2,12 +2,35 @@
 """
 Sentiment DL Worker (sin transformers.pipeline)
 
-- Lee documentos NO procesados desde MongoDB.
+- Lee documentos NO procesados desde MongoDB. Por defecto los toma por lote con un
+  lease (--claim-mode lease); los 'locked' con lease vencido (worker caido) se recuperan.
 - Predice sentimiento con el modelo HF 'tabularisai/multilingual-sentiment-analysis'
   usando PyTorch (AutoTokenizer + AutoModelForSequenceClassification; softmax manual).
-- Marca el documento en Mongo como procesado (o error).
-- Inserta una fila en MySQL (lab.dw_messages) con id,user_id,comment,label,score.
+- Marca los documentos en Mongo como procesados (o error) con un bulk_write por lote.
+- Inserta el lote en MySQL (lab.dw_messages) con id,user_id,comment,label,score
+  en una sola transaccion (INSERT multi-fila via executemany). En la misma transaccion
+  actualiza el rollup diario dw_sentiment_daily (dw_rollup.py; --no-rollup lo desactiva).
   La columna ingest_ts la genera MySQL con DEFAULT CURRENT_TIMESTAMP.
+- Con --pipeline, claim/tokenize/infer/sink corren en hilos con colas acotadas.
+- Cache de predicciones (LRU en proceso + Redis opcional) para comentarios repetidos,
+  activo por defecto (--cache-size 10000; 0 lo desactiva). Dentro de un lote, los textos
+  repetidos se infieren una sola vez.
+- Con --workers N, N procesos de inferencia comparten el modelo (fork) y este proceso
+  coordina claim y escritura.
+- Con --adaptive-batch el tamano de lote se ajusta en caliente (BatchController) segun
+  backlog, p95 objetivo (--target-p95-ms, desde la llegada del mensaje segun su trace)
+  y tiempos medidos de infer/sink.
+- Con --kafka-bootstrap (modo stream) consume el topico directo, sin pasar por Mongo:
+  micro-lotes por tamano (--batch-size) o edad (--max-latency-ms), misma inferencia y
+  mapeo de etiquetas, upsert en dw_messages (siempre ON DUPLICATE KEY UPDATE: un lote
+  re-entregado es idempotente) y recien entonces commit de offsets. La coleccion cruda
+  de Mongo recibe los documentos (ya con proc/pred) de forma asincrona, solo como
+  auditoria (AuditSink: nunca frena el camino Kafka -> MySQL; si Mongo no da abasto
+  los lotes van a --audit-spill).
+- Arranque rapido: torch/transformers se importan despues de validar args y conexiones
+  (Mongo ping, MySQL); con --snapshot el modelo sale de un directorio de snapshot_model.py
+  (safetensors + modelo trazado opcional) sin tocar el Hub. Cada fase del arranque y la
+  primera prediccion se miden y se loguean ("arranque: args=.. mongo=.. ... total=..").
 
 Uso ejemplo (VM):
   python3 scripts/sentiment_dl_worker.py \
@@ -17,25 +40,56 @@ Uso ejemplo (VM):
     --mysql-user root --mysql-pass pass --mysql-db lab \
     --batch-size 64 --max-docs 0 --poll-wait 2 --raw-json
 
+  Arranque offline desde snapshot:
+    python3 scripts/snapshot_model.py --out /opt/models/sentiment --engine torchscript
+    python3 scripts/sentiment_dl_worker.py ... --snapshot /opt/models/sentiment
+
+  Modo stream (Kafka -> MySQL, reemplaza consumer_to_mongo.py + worker en el camino critico):
+    python3 scripts/sentiment_dl_worker.py ... --kafka-bootstrap 127.0.0.1:29092 \
+      --kafka-topic user-topic --batch-size 64 --max-latency-ms 200 --audit-spill audit_spill.jsonl
+
 Requisitos:
   pip install torch transformers pymongo mysql-connector-python
+  (opcional, --redis-url) pip install redis
+  (opcional, --kafka-bootstrap) pip install kafka-python
 """
 
 import argparse
+import bisect
+import gc
+import hashlib
 import json
 import logging
+import multiprocessing as mp
+import os
 import signal
+import queue
+import socket
 import sys
+import threading
 import time
-from datetime import datetime, timezone
-from typing import Dict, List
+import types
+import unicodedata
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 
 import mysql.connector
 from mysql.connector import errorcode
-from pymongo import MongoClient, ReturnDocument
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import torch
-import torch.nn.functional as F
+from pymongo import ASCENDING, MongoClient, ReturnDocument, UpdateOne
+from dw_rollup import apply_rollup, ensure_rollup_table, read_contrib
+from trace_metrics import TraceMetrics, stamp
+
+# torch/transformers NO se importan aqui: cuestan segundos y main() los importa recien
+# despues de validar argumentos y conexiones (ver load_model). Las funciones que los
+# usan los importan localmente; tras el primer import es solo un lookup en sys.modules.
+
+PROCESS_T0 = time.perf_counter()
+
+SNAPSHOT_MANIFEST = "snapshot.json"
+SNAPSHOT_TRACED = "traced.pt"
+DEFAULT_ID2LABEL = {0: "Very Negative", 1: "Negative", 2: "Neutral", 3: "Positive", 4: "Very Positive"}
 
 
 def utcnow_iso() -> str:
@@ -57,14 +111,75 @@ def parse_args():
     # Inference
     p.add_argument("--model", default="tabularisai/multilingual-sentiment-analysis")
     p.add_argument("--max-length", type=int, default=256)
-    p.add_argument("--batch-size", type=int, default=64)
+    p.add_argument("--engine", choices=["eager", "int8-dynamic", "torchscript"], default=None,
+                   help="backend de inferencia: eager fp32, cuantizacion dinamica int8 de Linear, o TorchScript "
+                        "(default: eager, o el engine del snapshot con --snapshot)")
+    p.add_argument("--snapshot", default=None,
+                   help="directorio de snapshot_model.py: arranca offline desde disco, sin resolver --model")
+    p.add_argument("--batch-size", type=int, default=64, help="tamano de lote (inicial con --adaptive-batch)")
+    p.add_argument("--adaptive-batch", action="store_true",
+                   help="ajusta el lote en caliente segun backlog, p95 objetivo y tiempos de infer/sink")
+    p.add_argument("--min-batch", type=int, default=8)
+    p.add_argument("--max-batch", type=int, default=512, help="tope del lote (--adaptive-batch o --max-tokens)")
+    p.add_argument("--target-p95-ms", type=float, default=1000.0,
+                   help="p95 objetivo de latencia por mensaje, desde su llegada (trace produce/consume/mongo; "
+                        "sin trace, desde el claim) hasta el commit en MySQL")
+    p.add_argument("--adapt-every", type=float, default=2.0, help="segundos entre decisiones del controlador")
+    p.add_argument("--bucketing", action="store_true",
+                   help="agrupa cada lote por longitud en tokens (buckets 16/32/64/...) para reducir padding")
+    p.add_argument("--max-tokens", type=int, default=0,
+                   help="presupuesto de tokens con padding por sub-lote (--bucketing); 0 = sin presupuesto. "
+                        "Sin --adaptive-batch tambien dimensiona el claim: max_tokens / media de tokens por "
+                        "documento, entre --batch-size y --max-batch")
     p.add_argument("--max-docs", type=int, default=0, help="0 = sin limite (corre continuamente)")
-    p.add_argument("--poll-wait", type=float, default=2.0, help="segundos de espera cuando no hay pendientes")
-    p.add_argument("--raw-json", action="store_true", help="guardar el documento original en dw_messages.raw_json")
+    p.add_argument("--poll-wait", type=float, default=2.0,
+                   help="segundos de espera cuando no hay pendientes (poll) o tope del backoff")
+    p.add_argument("--wakeup", choices=["changestream", "backoff", "poll"], default="changestream",
+                   help="changestream = despertar con inserts (cae a backoff si no hay replica set); "
+                        "backoff = polling exponencial hasta --poll-wait; poll = espera fija --poll-wait")
+    p.add_argument("--idle-recheck", type=float, default=30.0,
+                   help="con change streams, re-claim periodico en reposo (leases vencidos)")
+    p.add_argument("--raw-json", action="store_true", help="guardar el documento original en dw_messages.raw_json (con su trace hasta 'infer')")
+    # Claim de trabajo
+    p.add_argument("--claim-mode", choices=["lease", "single"], default="lease",
+                   help="lease = claim por lote con lease; single = find_one_and_update por documento (legado)")
+    p.add_argument("--lease-secs", type=float, default=300.0,
+                   help="duracion del lease; docs 'locked' con lease vencido se vuelven a tomar")
+    p.add_argument("--worker-id", default=None, help="id del worker (default: host:pid)")
+    # Pipeline
+    p.add_argument("--pipeline", action="store_true",
+                   help="etapas claim -> tokenize -> infer -> sink en hilos separados con colas acotadas")
+    p.add_argument("--queue-depth", type=int, default=2, help="lotes maximos en cola entre etapas (--pipeline)")
+    # Multiproceso
+    p.add_argument("--workers", type=int, default=1,
+                   help="procesos de inferencia (fork, pesos compartidos copy-on-write); claim/sink en el proceso padre")
+    p.add_argument("--threads-per-worker", type=int, default=0,
+                   help="torch.set_num_threads por proceso; 0 = nucleos / --workers")
+    # Modo stream (Kafka -> inferencia directa, sin staging en Mongo)
+    p.add_argument("--kafka-bootstrap", default=None,
+                   help="consume el topico directo (modo stream); Mongo queda solo como auditoria asincrona")
+    p.add_argument("--kafka-topic", default="user-topic")
+    p.add_argument("--kafka-group", default="dl-stream")
+    p.add_argument("--max-latency-ms", type=float, default=200.0,
+                   help="modo stream: cierra el micro-lote a esta edad aunque no llegue a --batch-size")
+    p.add_argument("--audit-inflight", type=int, default=4,
+                   help="modo stream: lotes de auditoria en cola hacia Mongo; con la cola llena se derivan a --audit-spill")
+    p.add_argument("--audit-spill", default=None,
+                   help="modo stream: JSONL para lotes de auditoria que no entran en la cola o que Mongo rechaza "
+                        "(sin archivo se descartan y se cuentan)")
+    # Cache de predicciones
+    p.add_argument("--cache-size", type=int, default=10000, help="entradas LRU en proceso (activo por defecto); 0 = sin cache")
+    p.add_argument("--redis-url", default=None, help="tier compartido opcional, ej: redis://127.0.0.1:6379/0")
+    p.add_argument("--cache-ttl", type=int, default=86400, help="TTL (s) de las entradas en Redis")
     # Idempotencia
     p.add_argument("--upsert", action="store_true", help="ON DUPLICATE KEY UPDATE en MySQL")
-    # Logging
+    p.add_argument("--no-rollup", action="store_true",
+                   help="no mantener dw_sentiment_daily (reconstruible luego con dw_rollup.py)")
+    # Logging / metricas
     p.add_argument("--log-every", type=int, default=100)
+    p.add_argument("--metrics-file", default=None,
+                   help="JSON periodico con histogramas de latencia por etapa (produce -> ... -> commit)")
+    p.add_argument("--metrics-every", type=float, default=10.0, help="segundos entre volcados de --metrics-file")
     return p.parse_args()
 
 
@@ -103,7 +218,7 @@ def build_insert_sql(use_upsert: bool) -> str:
             " ON DUPLICATE KEY UPDATE "
             "user_id=VALUES(user_id), comment=VALUES(comment), "
             "sentiment_label=VALUES(sentiment_label), sentiment_score=VALUES(sentiment_score), "
-            "raw_json=VALUES(raw_json)"
+            "raw_json=COALESCE(VALUES(raw_json), raw_json)"  # sin --raw-json no borra el guardado
         )
     return base
 
@@ -133,6 +248,181 @@ def essential_str(v) -> str:
     return "" if v is None else str(v)
 
 
+class LatencyWindow:
+    """
+    Ventana deslizante de latencias (ms) para reportar percentiles en el log.
+    """
+
+    def __init__(self, size: int = 1000):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+
+    def add(self, ms: float) -> None:
+        self.samples.append(ms)
+        self.count += 1
+
+    def pct(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        data = sorted(self.samples)
+        return data[min(len(data) - 1, int(q / 100.0 * len(data)))]
+
+    def summary(self) -> str:
+        if not self.samples:
+            return "n=0"
+        return f"n={self.count} p50={self.pct(50):.1f}ms p95={self.pct(95):.1f}ms p99={self.pct(99):.1f}ms"
+
+
+# Etapas del trace anteriores al claim: la mas temprana presente marca la llegada del mensaje
+ARRIVAL_STAGES = ("produce", "consume", "mongo")
+
+
+class BatchController:
+    """
+    Tamano de lote adaptativo (--adaptive-batch) para claim e inferencia. Cada 'every'
+    segundos decide con:
+      - p95 de latencia por mensaje desde su llegada (espera en cola + claim -> commit
+        en MySQL) y p95 del tiempo de servicio (claim -> commit),
+      - backlog reclamable (backlog_fn(limite), un count acotado),
+      - modelo lineal del tiempo de servicio por lote: infer + sink ~ fijo + por_doc * n.
+    Servicio sobre el objetivo: el lote solo ya no cumple, reduce x0.7. Backlog mayor que
+    el lote: crece hasta cubrirlo (al menos x1.5) sin pasar del tamano cuyo servicio
+    predicho cabe en el 80% del objetivo, asi una rafaga se absorbe en una sola decision
+    (la espera en cola no achica el lote: solo se drena con mas throughput). Backlog bajo
+    (goteo): baja hacia 2x el backlog, asi la proxima rafaga arranca con un lote que cumple.
+    Siempre dentro de [min_size, max_size]; cada cambio se loguea con sus motivos.
+    """
+
+    def __init__(self, initial: int, min_size: int, max_size: int, target_p95_ms: float, backlog_fn,
+                 log: logging.Logger, every: float = 2.0, clock=time.monotonic):
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.cur = max(self.min_size, min(self.max_size, initial))
+        self.target = target_p95_ms
+        self.backlog_fn = backlog_fn
+        self.log = log
+        self.every = every
+        self.clock = clock
+        self.lat = LatencyWindow(200)  # llegada -> commit
+        self.svc = LatencyWindow(200)  # claim -> commit
+        self.service: deque = deque(maxlen=200)  # (n, ms de infer + sink)
+        self.lock = threading.Lock()
+        self.last = clock()
+        self.changes = 0
+
+    def size(self) -> int:
+        return self.cur
+
+    def observe(self, n: int, infer_ms: float, sink_ms: float, latency_ms: float, wait_ms: float = 0.0) -> None:
+        """latency_ms: claim -> commit del lote; wait_ms: espera previa al claim de su mensaje mas viejo."""
+        with self.lock:
+            self.service.append((n, infer_ms + sink_ms))
+            self.svc.add(latency_ms)
+            self.lat.add(latency_ms + max(0.0, wait_ms))
+            if self.clock() - self.last >= self.every and len(self.lat.samples) >= 3:
+                self.last = self.clock()
+                self._decide()
+
+    def model(self) -> Tuple[float, float]:
+        """(fijo_ms, por_doc_ms) por minimos cuadrados sobre los lotes recientes."""
+        xs = [float(n) for n, _ in self.service]
+        ys = [ms for _, ms in self.service]
+        mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+        var = sum((x - mx) ** 2 for x in xs)
+        if var == 0:
+            return 0.0, my / max(mx, 1.0)
+        slope = sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / var
+        slope = max(slope, 1e-6)
+        return max(0.0, my - slope * mx), slope
+
+    def _decide(self) -> None:
+        p95 = self.lat.pct(95)
+        svc95 = self.svc.pct(95)
+        backlog = self.backlog_fn(2 * self.max_size)
+        fixed, per_doc = self.model()
+        cap = int((0.8 * self.target - fixed) / per_doc)
+        b = self.cur
+        if svc95 > self.target:
+            new, why = int(b * 0.7), "servicio sobre objetivo"
+        elif backlog > b:
+            new, why = max(b, min(max(int(b * 1.5) + 1, backlog), cap)), "backlog"
+        elif backlog < b // 2:
+            new, why = max(2 * backlog, int(b * 0.7)), "goteo"
+        else:
+            return
+        new = max(self.min_size, min(self.max_size, new))
+        if new == b:
+            return
+        self.log.info(f"batch {b} -> {new} ({why}: p95={p95:.0f}ms servicio={svc95:.0f}ms objetivo={self.target:.0f}ms "
+                      f"backlog={backlog} servicio~{fixed:.0f}+{per_doc:.2f}*n ms)")
+        self.cur = new
+        self.changes += 1
+        self.lat.samples.clear()  # el p95 siguiente debe reflejar el tamano nuevo
+        self.svc.samples.clear()
+
+    def summary(self) -> str:
+        return f"batch={self.cur} cambios={self.changes} p95={self.lat.pct(95):.0f}ms servicio={self.svc.pct(95):.0f}ms"
+
+
+def ensure_claim_index(coll) -> None:
+    """
+    Indice que respalda el filtro de claim (pendientes y leases vencidos).
+    """
+    coll.create_index([("proc.status", ASCENDING), ("proc.lease_until", ASCENDING)], name="proc_claim", background=True)
+
+
+def claimable_filter(lease_secs: float) -> dict:
+    """
+    Documentos que se pueden tomar:
+      - sin 'proc' (pendientes),
+      - 'locked' con lease vencido (worker caido),
+      - 'locked' legado sin lease y con proc.ts mas viejo que lease_secs.
+    """
+    now = time.time()
+    legacy_cutoff = (datetime.now(timezone.utc) - timedelta(seconds=lease_secs)).isoformat()
+    return {
+        "$or": [
+            {"proc.status": None},
+            {"proc.status": "locked", "proc.lease_until": {"$lt": now}},
+            {"proc.status": "locked", "proc.lease_until": {"$exists": False}, "proc.ts": {"$lt": legacy_cutoff}},
+        ]
+    }
+
+
+def lock_batch_lease(coll, n: int, worker_id: str, lease_secs: float, rounds: int = 3) -> List[dict]:
+    """
+    Toma hasta n documentos en 3 operaciones por ronda, sin importar n:
+      1) lee los _id candidatos (el filtro usa el indice proc_claim; no es una consulta
+         cubierta: _id y proc.ts salen del documento),
+      2) update_many estampa un lease unico re-validando el filtro (dos workers no ganan el mismo doc),
+      3) lee de vuelta solo los documentos cuyo lease es el nuestro.
+    Todos los workers leen los mismos primeros candidatos: si otro gano parte de ellos el
+    lote queda corto y se repite la ronda por lo que falta, hasta 'rounds' veces.
+    """
+    flt = claimable_filter(lease_secs)
+    out: List[dict] = []
+    for _ in range(rounds):
+        ids = [d["_id"] for d in coll.find(flt, {"_id": 1}).limit(n - len(out))]
+        if not ids:
+            break
+        lease = uuid.uuid4().hex
+        coll.update_many(
+            {"$and": [{"_id": {"$in": ids}}, flt]},
+            {"$set": {"proc": {
+                "status": "locked",
+                "ts": utcnow_iso(),
+                "worker": worker_id,
+                "lease": lease,
+                "lease_until": time.time() + lease_secs,
+            }}},
+        )
+        got = list(coll.find({"_id": {"$in": ids}, "proc.lease": lease}))
+        out.extend(got)
+        if len(got) == len(ids):  # sin competencia: el lote esta completo o no hay mas pendientes
+            break
+    return out
+
+
 def lock_batch(coll, n: int) -> List[dict]:
     """
     Toma hasta n documentos sin procesar (ausencia de 'proc') y los marca como locked.
@@ -151,6 +441,1043 @@ def lock_batch(coll, n: int) -> List[dict]:
     return out
 
 
+def mark_done_op(d: dict, label: str, score: float) -> UpdateOne:
+    return UpdateOne(
+        {"_id": d["_id"]},
+        {"$set": {"proc.status": "done", "proc.ts": utcnow_iso(), "pred.label": label, "pred.score": score}},
+    )
+
+
+def mark_error_op(d: dict, err: str) -> UpdateOne:
+    return UpdateOne({"_id": d["_id"]}, {"$set": {"proc.status": "error", "proc.ts": utcnow_iso(), "proc.error": err}})
+
+
+def release_op(d: dict) -> UpdateOne:
+    """Devuelve el documento a pendiente (sin 'proc') para que el proximo claim lo retome."""
+    return UpdateOne({"_id": d["_id"]}, {"$unset": {"proc": ""}})
+
+
+def apply_mongo_ops(coll, ops: List[UpdateOne], log: logging.Logger) -> None:
+    """
+    Publica los estados proc/pred del lote en un solo bulk_write no ordenado.
+    """
+    if not ops:
+        return
+    try:
+        coll.bulk_write(ops, ordered=False)
+    except Exception as e:
+        log.error(f"mongo_bulk_error: {e}")
+
+
+def build_row(d: dict, label: str, score: float, raw_json: bool) -> tuple:
+    return (
+        str(d.get("_id")),
+        essential_str(d.get("user_id", "")),
+        essential_str(d.get("comment", "")),
+        label,
+        score,
+        json.dumps(d, ensure_ascii=False) if raw_json else None,
+    )
+
+
+# Errores que no son culpa de una fila: contencion de locks o conexion perdida. Se
+# reintenta la transaccion entera; solo los errores de datos quedan como 'error' por fila.
+MYSQL_TRANSIENT_ERRNOS = (
+    errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT,
+    errorcode.CR_CONNECTION_ERROR, errorcode.CR_CONN_HOST_ERROR,
+    errorcode.CR_SERVER_GONE_ERROR, errorcode.CR_SERVER_LOST,
+)
+
+
+def mysql_transient(e: Exception) -> bool:
+    return (getattr(e, "errno", None) in MYSQL_TRANSIENT_ERRNOS
+            or isinstance(e, (mysql.connector.InterfaceError, mysql.connector.OperationalError)))
+
+
+def write_dw(conn, insert_sql: str, rows: List[tuple], rollup: bool, log: logging.Logger) -> Dict[int, str]:
+    """
+    Escribe rows en dw_messages en UNA transaccion; executemany reescribe el INSERT (con
+    o sin ON DUPLICATE KEY UPDATE) como multi-fila. Con rollup, la misma transaccion aplica
+    a dw_sentiment_daily la diferencia de aporte de los ids (antes/despues), asi --upsert
+    no cuenta doble. Si el lote falla por un error de datos, se reintenta fila a fila en
+    otra transaccion para aislar las filas malas. Devuelve {indice: error} de las filas no
+    escritas. Un error transitorio (mysql_transient: deadlock, lock wait timeout, conexion)
+    en cualquiera de los dos intentos, o un fallo de la transaccion fila a fila, deshace y
+    propaga el mysql.connector.Error: ver write_dw_retry.
+    """
+    failed: Dict[int, str] = {}
+    ids = [r[0] for r in rows]
+    cur = conn.cursor()
+    try:
+        try:
+            conn.start_transaction()
+            before = read_contrib(cur, ids) if rollup else None
+            cur.executemany(insert_sql, rows)
+            if rollup:
+                apply_rollup(cur, ids, before)
+            conn.commit()
+        except mysql.connector.Error as me:
+            try:
+                conn.rollback()
+            except mysql.connector.Error:
+                pass
+            if mysql_transient(me):
+                raise
+            log.warning(f"lote MySQL fallo ({getattr(me, 'msg', me)}); reintentando fila a fila")
+            try:
+                conn.start_transaction()
+                before = read_contrib(cur, ids) if rollup else None
+                for i, row in enumerate(rows):
+                    try:
+                        cur.execute(insert_sql, row)
+                    except mysql.connector.Error as re:
+                        if mysql_transient(re):
+                            raise
+                        failed[i] = f"mysql_error: {getattr(re, 'msg', re)}"
+                if rollup:
+                    apply_rollup(cur, ids, before)
+                conn.commit()
+            except mysql.connector.Error:
+                try:
+                    conn.rollback()
+                except mysql.connector.Error:
+                    pass
+                raise
+    finally:
+        cur.close()
+    return failed
+
+
+def write_dw_retry(conn, insert_sql: str, rows: List[tuple], rollup: bool, log: logging.Logger,
+                   retries: int = 5) -> Dict[int, str]:
+    """
+    write_dw reintentando la transaccion entera ante errores transitorios, con backoff
+    exponencial y reconexion si la conexion se cayo (como write_stream). Agotados los
+    reintentos propaga el ultimo error.
+    """
+    backoff = 0.5
+    for attempt in range(retries + 1):
+        try:
+            return write_dw(conn, insert_sql, rows, rollup, log)
+        except mysql.connector.Error as e:
+            if not mysql_transient(e) or attempt == retries:
+                raise
+            log.warning(f"MySQL transitorio ({getattr(e, 'msg', e)}); reintento del lote en {backoff:.1f}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 10.0)
+            try:
+                if not conn.is_connected():
+                    conn.reconnect(attempts=1, delay=0)
+            except mysql.connector.Error:
+                pass
+
+
+def sink_batch(conn, coll, insert_sql: str, results: List[tuple], raw_json: bool, log: logging.Logger,
+               metrics: Optional[TraceMetrics] = None, rollup: bool = False) -> int:
+    """
+    Escribe el lote (doc, label, score) en dw_messages (write_dw_retry) y publica proc/pred
+    en Mongo con un bulk_write. Las filas que MySQL rechaza por sus datos quedan en 'error';
+    si MySQL sigue sin responder tras los reintentos el lote vuelve a pendiente (sin
+    'proc') para un proximo claim. Devuelve el numero de filas escritas. El trace del
+    documento solo se guarda en la fila via raw_json y sin 'commit' (la fila se arma
+    antes); 'commit' se estampa despues y va solo a metrics (--metrics-file).
+    """
+    ops: List[UpdateOne] = []
+    pending = []
+    for d, label, score in results:
+        try:
+            pending.append((d, label, score, build_row(d, label, score, raw_json)))
+        except Exception as e:
+            ops.append(mark_error_op(d, f"proc_error: {e}"))
+            log.error(f"proc_error: {e}")
+
+    try:
+        failed = write_dw_retry(conn, insert_sql, [p[3] for p in pending], rollup, log)
+    except mysql.connector.Error as fe:
+        if mysql_transient(fe):
+            log.error(f"MySQL no disponible ({getattr(fe, 'msg', fe)}); {len(pending)} documentos vuelven a pendiente")
+            apply_mongo_ops(coll, ops + [release_op(p[0]) for p in pending], log)
+            return 0
+        err = f"mysql_error: {getattr(fe, 'msg', fe)}"
+        failed = {i: err for i in range(len(pending))}
+
+    committed = time.time()
+    for i, (d, label, score, _row) in enumerate(pending):
+        if i in failed:
+            ops.append(mark_error_op(d, failed[i]))
+            log.error(failed[i])
+        else:
+            ops.append(mark_done_op(d, label, score))
+            if metrics is not None:
+                stamp([d], "commit", committed)
+                metrics.observe_trace(d["trace"])
+    apply_mongo_ops(coll, ops, log)
+    return len(pending) - len(failed)
+
+
+def audit_doc(d: dict, label: Optional[str] = None, score: Optional[float] = None,
+              err: Optional[str] = None) -> dict:
+    """
+    Documento de auditoria del modo stream para la coleccion cruda: el minimo de
+    consumer_to_mongo con proc/pred ya resueltos, asi un worker en modo Mongo sobre la
+    misma coleccion no lo vuelve a tomar.
+    """
+    out = dict(d)
+    if err is not None:
+        out["proc"] = {"status": "error", "ts": utcnow_iso(), "error": err, "source": "stream"}
+    else:
+        out["proc"] = {"status": "done", "ts": utcnow_iso(), "source": "stream"}
+        out["pred"] = {"label": label, "score": score}
+    return out
+
+
+class AuditSink:
+    """
+    Auditoria asincrona del modo stream: un BulkWriter (consumer_to_mongo) con cola
+    acotada, pero submit() nunca bloquea. Si la cola esta llena (Mongo lento o caido)
+    el lote va a 'spill' (JSONL) o se descarta y se cuenta; el BulkWriter manda al mismo
+    archivo lo que Mongo rechaza o lo que agota sus reintentos. close() espera a lo sumo
+    'timeout' segundos y vuelca a disco lo que siga en cola.
+    """
+
+    def __init__(self, coll, inflight: int, spill: Optional[str], log: logging.Logger):
+        from consumer_to_mongo import BulkWriter
+        self.writer = BulkWriter(coll, inflight, dead_letter=spill, best_effort=True)
+        self.path = spill
+        self.log = log
+        self.spilled = 0
+        self.writer.start()
+
+    def submit(self, docs: List[dict]) -> None:
+        if not docs:
+            return
+        try:
+            self.writer.q.put_nowait((docs, {}))
+        except queue.Full:
+            self.spill(docs)
+
+    def spill(self, docs: List[dict]) -> None:
+        self.spilled += len(docs)
+        if not self.path:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                for d in docs:
+                    f.write(json.dumps(d, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            self.log.error(f"auditoria: spill no escribible ({e})")
+
+    def close(self, timeout: float = 5.0) -> None:
+        q = self.writer.q
+        deadline = time.monotonic() + timeout
+        while q.unfinished_tasks and self.writer.is_alive() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        while True:
+            try:
+                item = q.get_nowait()
+            except queue.Empty:
+                break
+            q.task_done()
+            if item is not None:
+                self.spill(item[0])
+        try:
+            q.put_nowait(None)
+        except queue.Full:
+            pass
+        self.writer.join(timeout=1.0)  # hilo daemon: si sigue en un bulk_write, se abandona
+        if self.spilled:
+            self.log.warning(f"auditoria: {self.spilled} documentos a {self.path or 'descarte'} sin pasar por Mongo")
+
+    def report(self) -> str:
+        return f"{self.writer.report()} spill={self.spilled}"
+
+
+def sink_stream_batch(conn, insert_sql: str, results: List[tuple], raw_json: bool, log: logging.Logger,
+                      metrics: Optional[TraceMetrics] = None, rollup: bool = False) -> Tuple[int, List[dict]]:
+    """
+    Como sink_batch pero sin staging en Mongo: escribe dw_messages (write_dw) y devuelve
+    (filas escritas, documentos de auditoria). Si MySQL no responde propaga el error,
+    para que el llamador reintente antes de commitear offsets de Kafka.
+    """
+    audit: List[dict] = []
+    pending = []
+    for d, label, score in results:
+        try:
+            pending.append((d, label, score, build_row(d, label, score, raw_json)))
+        except Exception as e:
+            audit.append(audit_doc(d, err=f"proc_error: {e}"))
+            log.error(f"proc_error: {e}")
+
+    failed = write_dw(conn, insert_sql, [p[3] for p in pending], rollup, log)
+    committed = time.time()
+    for i, (d, label, score, _row) in enumerate(pending):
+        if i in failed:
+            audit.append(audit_doc(d, err=failed[i]))
+            log.error(failed[i])
+        else:
+            stamp([d], "commit", committed)
+            if metrics is not None:
+                metrics.observe_trace(d["trace"])
+            audit.append(audit_doc(d, label, score))
+    return len(pending) - len(failed), audit
+
+
+def model_text(d: dict) -> str:
+    return essential_str(d.get("comment", "")).strip() or " "
+
+
+class PredictionCache:
+    """
+    Memoiza (label, score) por modelo, engine, --max-length y hash del comentario
+    normalizado: int8-dynamic/TorchScript dan scores algo distintos que eager, y en el
+    tier Redis compartido no deben mezclarse.
+    Tier 1: LRU acotado en proceso. Tier 2 opcional: Redis compartido entre workers
+    (un MGET por lote para los fallos locales, SET con TTL en pipeline).
+    """
+
+    def __init__(self, model: str, max_length: int, size: int, redis_url: Optional[str] = None, ttl: int = 86400,
+                 engine: str = "eager"):
+        self.prefix = f"{model}|{engine}|{max_length}|"
+        self.size = size
+        self.ttl = ttl
+        self.lru: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rds = None
+        if redis_url:
+            try:
+                import redis
+            except ImportError:
+                raise SystemExit("ERROR: --redis-url requiere el paquete 'redis' (pip install redis)")
+            self.rds = redis.Redis.from_url(redis_url)
+
+    def key(self, text: str) -> str:
+        norm = " ".join(unicodedata.normalize("NFC", text).split())
+        return "pred:" + hashlib.sha1((self.prefix + norm).encode("utf-8")).hexdigest()
+
+    def _remember(self, k: str, val: Tuple[str, float]) -> None:
+        self.lru[k] = val
+        self.lru.move_to_end(k)
+        if len(self.lru) > self.size:
+            self.lru.popitem(last=False)
+            self.evictions += 1
+
+    def get_many(self, texts: List[str]) -> List[Optional[Tuple[str, float]]]:
+        keys = [self.key(t) for t in texts]
+        out: List[Optional[Tuple[str, float]]] = []
+        with self.lock:
+            for k in keys:
+                val = self.lru.get(k)
+                if val is not None:
+                    self.lru.move_to_end(k)
+                out.append(val)
+        missing = [i for i, v in enumerate(out) if v is None]
+        if self.rds is not None and missing:
+            try:
+                raw = self.rds.mget([keys[i] for i in missing])
+            except Exception:
+                raw = [None] * len(missing)
+            with self.lock:
+                for i, r in zip(missing, raw):
+                    if not r:
+                        continue
+                    try:
+                        label, score = r.decode("utf-8").split("|", 1)
+                        val = (label, float(score))
+                    except ValueError:  # valor corrupto o de otro formato: cuenta como fallo
+                        continue
+                    out[i] = val
+                    self._remember(keys[i], val)
+                    self.redis_hits += 1
+        with self.lock:
+            n_hit = sum(1 for v in out if v is not None)
+            self.hits += n_hit
+            self.misses += len(out) - n_hit
+        return out
+
+    def put_many(self, items: List[Tuple[str, str, float]]) -> None:
+        keyed = [(self.key(t), (label, score)) for t, label, score in items]
+        with self.lock:
+            for k, val in keyed:
+                self._remember(k, val)
+        if self.rds is not None and keyed:
+            try:
+                pipe = self.rds.pipeline(transaction=False)
+                for k, (label, score) in keyed:
+                    pipe.set(k, f"{label}|{score}", ex=self.ttl or None)
+                pipe.execute()
+            except Exception:
+                pass
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return (f"cache hit={self.hits} (redis={self.redis_hits}) miss={self.misses} "
+                f"evict={self.evictions} rate={rate:.1f}%")
+
+
+def split_cached(cache: Optional[PredictionCache], batch: List[dict]) -> Tuple[List[tuple], List[dict]]:
+    """
+    Separa el lote en aciertos de cache (doc, label, score) y documentos a inferir.
+    """
+    if cache is None:
+        return [], batch
+    vals = cache.get_many([model_text(d) for d in batch])
+    hits = [(d, v[0], v[1]) for d, v in zip(batch, vals) if v is not None]
+    misses = [d for d, v in zip(batch, vals) if v is None]
+    return hits, misses
+
+
+BUCKET_EDGES = (16, 32, 64, 128, 256, 512)
+
+
+class PaddingStats:
+    """
+    Proporcion de tokens de padding sobre el total de tokens enviados al modelo.
+    """
+
+    def __init__(self):
+        self.real = 0
+        self.total = 0
+        self.rows = 0
+
+    def add(self, enc) -> None:
+        mask = enc["attention_mask"]
+        self.real += int(mask.sum())
+        self.total += int(mask.numel())
+        self.rows += int(mask.shape[0])
+
+    def mean_tokens(self) -> float:
+        return self.real / self.rows if self.rows else 0.0
+
+    def ratio(self) -> float:
+        return 1.0 - self.real / self.total if self.total else 0.0
+
+    def summary(self) -> str:
+        return f"padding={100.0 * self.ratio():.1f}%"
+
+
+def token_budget_size(pad_stats: PaddingStats, max_tokens: int, batch_size: int, max_batch: int) -> int:
+    """
+    Tamano de claim para --max-tokens sin --adaptive-batch: con textos cortos toma los
+    documentos que caben en el presupuesto segun la media de tokens reales vista hasta
+    ahora, nunca menos de batch_size ni mas de max_batch.
+    """
+    mean = pad_stats.mean_tokens()
+    if not mean:
+        return batch_size
+    return max(batch_size, min(max_batch, int(max_tokens // mean)))
+
+
+def bucket_groups(lengths: List[int], max_tokens: int = 0) -> List[List[int]]:
+    """
+    Ordena los indices por longitud y los corta en grupos que no cruzan un borde de
+    BUCKET_EDGES ni superan max_tokens (= filas * longitud maxima del grupo).
+    """
+    groups: List[List[int]] = []
+    cur: List[int] = []
+    cur_bucket = -1
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        b = bisect.bisect_left(BUCKET_EDGES, lengths[i])
+        if cur and (b != cur_bucket or (max_tokens and (len(cur) + 1) * lengths[i] > max_tokens)):
+            groups.append(cur)
+            cur = []
+        cur.append(i)
+        cur_bucket = b
+    if cur:
+        groups.append(cur)
+    return groups
+
+
+def encode_batch(tok, batch: List[dict], max_length: int, bucketing: bool = False, max_tokens: int = 0,
+                 pad_stats: Optional[PaddingStats] = None,
+                 dedup: bool = False) -> List[Tuple[List[List[dict]], object]]:
+    """
+    Tokeniza el lote y devuelve [(filas, enc)], con filas[i] = documentos de la fila i de
+    enc. Sin bucketing es un solo sub-lote rellenado a la longitud maxima; con bucketing
+    cada sub-lote se rellena solo hasta el mas largo de su bucket. Con dedup los textos
+    identicos del lote comparten una fila (se infieren una vez).
+    """
+    rows: List[List[dict]] = []
+    texts: List[str] = []
+    seen: Dict[str, int] = {}
+    for d in batch:
+        t = model_text(d)
+        if dedup and t in seen:
+            rows[seen[t]].append(d)
+            continue
+        seen[t] = len(rows)
+        rows.append([d])
+        texts.append(t)
+    if not bucketing:
+        parts = [(rows, tok(texts, padding=True, truncation=True, max_length=max_length, return_tensors="pt"))]
+    else:
+        feats = tok(texts, truncation=True, max_length=max_length)
+        keys = list(feats.keys())
+        parts = []
+        for g in bucket_groups([len(x) for x in feats["input_ids"]], max_tokens):
+            enc = tok.pad([{k: feats[k][i] for k in keys} for i in g], return_tensors="pt")
+            parts.append(([rows[i] for i in g], enc))
+    if pad_stats is not None:
+        for _sub, enc in parts:
+            pad_stats.add(enc)
+    return parts
+
+
+def infer_batch(mdl, parts: List[Tuple[List[List[dict]], object]], id2label: Dict[int, str]) -> List[tuple]:
+    """
+    Corre el modelo por sub-lote y devuelve (doc, label, score) por documento.
+    """
+    import torch
+    import torch.nn.functional as F
+
+    results = []
+    for rows, enc in parts:
+        with torch.no_grad():
+            out = mdl(**enc)
+        probs = F.softmax(out.logits, dim=-1)
+        for docs, prob in zip(rows, probs):
+            idx = int(torch.argmax(prob).item())
+            label, score = label_code_from_id2label(idx, id2label), float(prob[idx].item())
+            results.extend((d, label, score) for d in docs)
+    return results
+
+
+class TracedModel:
+    """
+    Adapta un modulo TorchScript (salida en tupla) a la interfaz mdl(**enc).logits.
+    Se traza solo con (input_ids, attention_mask): token_type_ids no se pasa. Para un
+    texto por fila (el caso del worker) vale cero en todas las posiciones, lo mismo que
+    usa el modelo cuando falta; si llegara con otro valor (pares de textos) se rechaza
+    en vez de ignorarlo en silencio.
+    """
+
+    def __init__(self, traced):
+        self.traced = traced
+
+    def __call__(self, **enc):
+        tt = enc.get("token_type_ids")
+        if tt is not None and bool(tt.any()):
+            raise ValueError("TorchScript trazado sin token_type_ids: no soporta pares de textos")
+        out = self.traced(enc["input_ids"], enc["attention_mask"])
+        return types.SimpleNamespace(logits=out[0])
+
+
+def build_engine(mdl, tok, engine: str, max_length: int):
+    """
+    Devuelve el modelo listo para inferencia segun --engine. El tokenizer y el
+    config (id2label) son los mismos, asi que el mapeo de etiquetas no cambia.
+    """
+    import torch
+
+    if engine == "int8-dynamic":
+        return torch.quantization.quantize_dynamic(mdl, {torch.nn.Linear}, dtype=torch.qint8)
+    if engine == "torchscript":
+        mdl.config.return_dict = False
+        ex = tok(["ejemplo de trazado", "otro texto un poco mas largo para trazar"], padding=True,
+                 truncation=True, max_length=max_length, return_tensors="pt")
+        with torch.no_grad():
+            traced = torch.jit.trace(mdl, (ex["input_ids"], ex["attention_mask"]), strict=False)
+            traced = torch.jit.freeze(traced.eval())
+        return TracedModel(traced)
+    return mdl
+
+
+class StartupTimer:
+    """
+    Duracion de cada fase del arranque (args, conexiones, imports, modelo, primera
+    prediccion) y total desde PROCESS_T0 (carga de este modulo).
+    """
+
+    def __init__(self):
+        self.last = PROCESS_T0
+        self.phases: "OrderedDict[str, float]" = OrderedDict()
+
+    def mark(self, phase: str) -> float:
+        now = time.perf_counter()
+        self.phases[phase] = (now - self.last) * 1000.0
+        self.last = now
+        return self.phases[phase]
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - PROCESS_T0) * 1000.0
+
+    def summary(self) -> str:
+        parts = [f"{k}={v:.0f}ms" for k, v in self.phases.items()]
+        return " ".join(parts + [f"total={self.total_ms():.0f}ms"])
+
+
+def read_snapshot(path: str) -> dict:
+    """Manifiesto de snapshot_model.py; id2label vuelve con claves int."""
+    with open(os.path.join(path, SNAPSHOT_MANIFEST), "r", encoding="utf-8") as f:
+        man = json.load(f)
+    man["id2label"] = {int(k): v for k, v in man["id2label"].items()}
+    return man
+
+
+def load_model(args, log: logging.Logger, timer: StartupTimer):
+    """
+    Importa transformers/torch y devuelve (tok, mdl, id2label, nombre_modelo, engine) con
+    el engine ya aplicado (con --snapshot, el engine resuelto puede venir del manifiesto).
+    Con --snapshot todo sale del directorio local (HF_HUB_OFFLINE, local_files_only): si
+    el snapshot trae un modelo trazado del engine pedido se carga con torch.jit.load y no
+    se instancia el modelo HF; si no, se cargan los safetensors y se aplica build_engine.
+    """
+    if args.snapshot:
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+    timer.mark("imports")
+
+    if not args.snapshot:
+        engine = args.engine or "eager"
+        log.info(f"Cargando modelo: {args.model}")
+        tok = AutoTokenizer.from_pretrained(args.model)
+        mdl = AutoModelForSequenceClassification.from_pretrained(args.model)
+        mdl.eval()
+        id2label = getattr(mdl.config, "id2label", DEFAULT_ID2LABEL)
+        name = args.model
+    else:
+        man = read_snapshot(args.snapshot)
+        engine = args.engine or man["engine"]
+        id2label = man["id2label"]
+        name = man["model"]
+        log.info(f"Cargando snapshot {args.snapshot} ({name}, engine={man['engine']})")
+        tok = AutoTokenizer.from_pretrained(args.snapshot, local_files_only=True)
+        if man.get("traced") and engine == man["engine"]:
+            traced = torch.jit.load(os.path.join(args.snapshot, man["traced"]))
+            timer.mark("modelo")
+            return tok, TracedModel(traced.eval()), id2label, name, engine
+        mdl = AutoModelForSequenceClassification.from_pretrained(args.snapshot, local_files_only=True)
+        mdl.eval()
+    timer.mark("modelo")
+
+    if engine != "eager":
+        log.info(f"Preparando engine: {engine}")
+        mdl = build_engine(mdl, tok, engine, args.max_length)
+        timer.mark("engine")
+    return tok, mdl, id2label, name, engine
+
+
+class Stage:
+    """
+    Etapa del pipeline: un hilo que toma lotes de q_in, aplica fn y deja el resultado en q_out.
+    fn devuelve None para descartar el lote (ya marcado como error). None en q_in = fin.
+    """
+
+    def __init__(self, name: str, fn, q_in: "queue.Queue", q_out: "queue.Queue", log: logging.Logger):
+        self.name = name
+        self.fn = fn
+        self.q_in = q_in
+        self.q_out = q_out
+        self.log = log
+        self.busy = 0.0
+        self.items = 0
+        self.thread = threading.Thread(target=self._run, name=f"stage-{name}", daemon=True)
+
+    def _run(self):
+        while True:
+            item = self.q_in.get()
+            if item is None:
+                break
+            t0 = time.perf_counter()
+            try:
+                res = self.fn(item)
+            except Exception as e:
+                self.log.error(f"etapa {self.name} fallo: {e}")
+                res = None
+            self.busy += time.perf_counter() - t0
+            self.items += 1
+            if res is not None and self.q_out is not None:
+                self.q_out.put(res)
+        if self.q_out is not None:
+            self.q_out.put(None)
+
+
+def pipeline_stats(stages: List[Stage], started: float) -> str:
+    """
+    Ocupacion (busy/wall) y profundidad de cola de entrada por etapa: la etapa
+    con mayor busy% y su cola de entrada llena es el cuello de botella.
+    """
+    wall = max(time.perf_counter() - started, 1e-9)
+    return " ".join(
+        f"{st.name}[busy={100.0 * st.busy / wall:.0f}% q={st.q_in.qsize()} n={st.items}]" for st in stages
+    )
+
+
+def run_pipeline(claim_fn, prepare_fn, predict_fn, sink_fn, waiter: "WorkWaiter", args, log: logging.Logger,
+                 stats_fn, size_fn=None) -> int:
+    """
+    Ejecuta claim -> tokenize -> infer -> sink en hilos con colas acotadas (--queue-depth),
+    de modo que el siguiente lote se toma y tokeniza mientras el actual corre por el modelo
+    y el anterior se escribe. Semantica at-least-once: el claim se detiene al recibir senal
+    y los lotes ya tomados se drenan; si el proceso muere, los leases vencen y se re-toman.
+    """
+    total_target = args.max_docs if args.max_docs > 0 else float("inf")
+    stop = threading.Event()
+    state = {"processed": 0, "next_log": args.log_every}
+    q_claim: "queue.Queue" = queue.Queue(maxsize=args.queue_depth)
+    q_tok: "queue.Queue" = queue.Queue(maxsize=args.queue_depth)
+    q_inf: "queue.Queue" = queue.Queue(maxsize=args.queue_depth)
+
+    def _sink(results):
+        state["processed"] += sink_fn(results)
+        if state["processed"] >= state["next_log"]:
+            log.info(f"Procesados: {state['processed']} | {stats_fn()} | {pipeline_stats(stages, started)}")
+            state["next_log"] = state["processed"] + args.log_every
+
+    stages = [
+        Stage("tokenize", prepare_fn, q_claim, q_tok, log),
+        Stage("infer", predict_fn, q_tok, q_inf, log),
+        Stage("sink", _sink, q_inf, None, log),
+    ]
+    claim_stage = {"busy": 0.0}
+
+    def _claim():
+        claimed = 0
+        try:
+            while not stop.is_set() and claimed < total_target:
+                t0 = time.perf_counter()
+                size = size_fn() if size_fn else args.batch_size
+                batch = claim_fn(int(min(size, total_target - claimed)))
+                claim_stage["busy"] += time.perf_counter() - t0
+                if not batch:
+                    waiter.wait()
+                    continue
+                claimed += len(batch)
+                q_claim.put(batch)
+        except Exception as e:
+            log.error(f"etapa claim fallo: {e}")
+        finally:
+            q_claim.put(None)
+
+    started = time.perf_counter()
+    claimer = threading.Thread(target=_claim, name="stage-claim", daemon=True)
+    for st in stages:
+        st.thread.start()
+    claimer.start()
+    try:
+        while stages[-1].thread.is_alive():
+            stages[-1].thread.join(timeout=0.5)
+    except GracefulExit:
+        stop.set()
+        waiter.wake()
+        log.info("Drenando lotes ya tomados...")
+        stages[-1].thread.join()
+        raise
+    finally:
+        wall = max(time.perf_counter() - started, 1e-9)
+        log.info(f"pipeline claim[busy={100.0 * claim_stage['busy'] / wall:.0f}%] {pipeline_stats(stages, started)}")
+    return state["processed"]
+
+
+def inference_proc(rank: int, threads: int, tok, mdl, id2label: Dict[int, str], args, q_in, q_out) -> None:
+    """
+    Proceso de inferencia para --workers: recibe (bid, textos) y devuelve
+    (bid, [(label, score)] en el orden de entrada, error, tokens_reales, tokens_totales).
+    tok/mdl se heredan por fork: los pesos se comparten copy-on-write con el padre.
+    El fork ocurre con los clientes de Mongo/MySQL/Redis ya abiertos en el padre; este
+    proceso no los usa (solo q_in/q_out y tok/mdl), asi sus sockets y locks heredados
+    no se tocan. Ignora SIGINT/SIGTERM: una senal al grupo de procesos la atiende el
+    padre, que drena los lotes en curso y termina cada hijo con el centinela None.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    import torch
+
+    torch.set_num_threads(threads)
+    parent = os.getppid()
+    while True:
+        try:
+            item = q_in.get(timeout=1.0)
+        except queue.Empty:
+            if os.getppid() != parent:  # el padre murio sin enviar el centinela
+                break
+            continue
+        if item is None:
+            break
+        bid, texts = item
+        if not texts:
+            q_out.put((bid, [], None, 0, 0))
+            continue
+        pad = PaddingStats()
+        docs = [{"comment": t, "_i": i} for i, t in enumerate(texts)]
+        try:
+            parts = encode_batch(tok, docs, args.max_length, args.bucketing, args.max_tokens, pad,
+                                 dedup=True)
+            preds: List[Optional[Tuple[str, float]]] = [None] * len(texts)
+            for d, label, score in infer_batch(mdl, parts, id2label):
+                preds[d["_i"]] = (label, score)
+            q_out.put((bid, preds, None, pad.real, pad.total))
+        except Exception as e:
+            q_out.put((bid, None, f"worker {rank}: {e}", 0, 0))
+
+
+def run_sharded(claim_fn, sink_fn, mark_errors, cache: Optional[PredictionCache], tok, mdl, id2label,
+                waiter: "WorkWaiter", args, log: logging.Logger, stats_fn, pad_stats: PaddingStats,
+                size_fn=None) -> int:
+    """
+    --workers N: un coordinador (este proceso) toma lotes y escribe resultados, y N procesos
+    hijos creados con fork hacen tokenize+infer, cada uno con --threads-per-worker hilos de
+    torch. El modelo se carga una sola vez antes del fork. La cola de tareas esta acotada
+    a 2*N lotes, asi el claim no se adelanta mas alla de lo que la inferencia absorbe.
+    """
+    ctx = mp.get_context("fork")
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+    q_task = ctx.Queue(maxsize=2 * args.workers)
+    q_res = ctx.Queue()
+    gc.freeze()  # evita que el GC toque (y copie) las paginas de objetos heredados
+    procs = [
+        ctx.Process(target=inference_proc, args=(r, threads, tok, mdl, id2label, args, q_task, q_res), daemon=True)
+        for r in range(args.workers)
+    ]
+    for pr in procs:
+        pr.start()
+    log.info(f"{args.workers} procesos de inferencia con {threads} hilos c/u")
+
+    total_target = args.max_docs if args.max_docs > 0 else float("inf")
+    stop = threading.Event()
+    claimed_all = threading.Event()
+    pending: Dict[int, Tuple[List[tuple], List[dict]]] = {}
+    lock = threading.Lock()
+
+    def _claim():
+        claimed = 0
+        bid = 0
+        try:
+            while not stop.is_set() and claimed < total_target:
+                size = size_fn() if size_fn else args.batch_size
+                batch = claim_fn(int(min(size, total_target - claimed)))
+                if not batch:
+                    waiter.wait()
+                    continue
+                claimed += len(batch)
+                hits, misses = split_cached(cache, batch)
+                with lock:
+                    pending[bid] = (hits, misses)
+                q_task.put((bid, [model_text(d) for d in misses]))
+                bid += 1
+        except Exception as e:
+            log.error(f"claim fallo: {e}")
+        finally:
+            claimed_all.set()
+            for _ in procs:
+                q_task.put(None)
+
+    claimer = threading.Thread(target=_claim, name="claim", daemon=True)
+    claimer.start()
+    processed = 0
+    next_log = args.log_every
+
+    def _collect() -> None:
+        nonlocal processed, next_log
+        while True:
+            with lock:
+                if claimed_all.is_set() and not pending:
+                    return
+            if not any(pr.is_alive() for pr in procs):
+                log.error("no quedan procesos de inferencia vivos")
+                return
+            try:
+                bid, preds, err, real, total = q_res.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with lock:
+                hits, misses = pending.pop(bid)
+            stamp([h[0] for h in hits], "infer")
+            pad_stats.real += real
+            pad_stats.total += total
+            pad_stats.rows += 0 if err else len(misses)
+            fresh = []
+            if err:
+                err = f"inferencia_fallo: {err}"
+                mark_errors(misses, err)
+                log.error(err)
+            else:
+                fresh = [(d, label, score) for d, (label, score) in zip(misses, preds)]
+                stamp(misses, "infer")
+                if cache is not None:
+                    cache.put_many([(model_text(d), label, score) for d, label, score in fresh])
+            if hits or fresh:
+                processed += sink_fn(hits + fresh)
+            if processed >= next_log:
+                log.info(f"Procesados: {processed} | {stats_fn()}")
+                next_log = processed + args.log_every
+
+    try:
+        _collect()
+    except GracefulExit:
+        stop.set()
+        waiter.wake()
+        log.info("Drenando lotes ya enviados a los procesos de inferencia...")
+        _collect()
+        raise
+    finally:
+        for pr in procs:
+            pr.join(timeout=5)
+            if pr.is_alive():  # ignoran SIGTERM; sin centinela a tiempo solo queda SIGKILL
+                pr.kill()
+                pr.join()
+    return processed
+
+
+def kafka_lag(consumer, limit: int) -> int:
+    """Mensajes pendientes en las particiones asignadas (backlog de --adaptive-batch en modo stream)."""
+    parts = list(consumer.assignment())
+    if not parts:
+        return 0
+    ends = consumer.end_offsets(parts)
+    return min(limit, sum(max(0, ends[tp] - consumer.position(tp)) for tp in parts))
+
+
+def run_stream(consumer, listener, prepare_fn, predict_fn, sink_fn, args, log: logging.Logger, stats_fn,
+               batch_lat: LatencyWindow, size_fn=None) -> int:
+    """
+    --kafka-bootstrap: consume el topico directo, sin staging en Mongo. Arma micro-lotes
+    de hasta --batch-size mensajes o --max-latency-ms desde el primero (lo que ocurra
+    antes), los pasa por prepare/predict/sink como run_serial y recien despues de que
+    sink_fn confirmo el INSERT en MySQL commitea los offsets del micro-lote.
+    Entrega at-least-once: un corte entre el commit de MySQL y el de Kafka re-entrega el
+    lote; en modo stream el INSERT es siempre upsert, asi el lote re-entregado se reescribe
+    igual (el rollup resta el aporte viejo y no cuenta doble).
+    Registros sin comment se descartan pero su offset avanza, como en consumer_to_mongo.
+    """
+    from consumer_to_mongo import offset_meta, to_minimal
+    from kafka.errors import CommitFailedError, RebalanceInProgressError
+
+    total_target = args.max_docs if args.max_docs > 0 else float("inf")
+    st = {"buf": [], "offs": {}, "first": None}
+    processed = 0
+    next_log = args.log_every
+
+    def flush() -> None:
+        nonlocal processed, next_log
+        if not st["offs"]:
+            return
+        batch, offs, first = st["buf"], st["offs"], st["first"]
+        st["buf"], st["offs"], st["first"] = [], {}, None
+        if batch:
+            batch_lat.add((time.monotonic() - first) * 1000.0)
+            stamp(batch, "claim")
+            results = predict_fn(prepare_fn(batch))
+            if results:
+                processed += sink_fn(results)
+        try:
+            consumer.commit(offsets={tp: offset_meta(off + 1) for tp, off in offs.items()})
+        except (CommitFailedError, RebalanceInProgressError) as e:
+            # el grupo cambio de generacion: el lote ya esta en MySQL (upsert) y el nuevo
+            # dueno de la particion lo re-lee; se sigue con el proximo poll
+            log.warning(f"commit de offsets omitido por rebalance ({e.__class__.__name__})")
+        if processed >= next_log:
+            log.info(f"Procesados: {processed} | {stats_fn()}")
+            next_log = processed + args.log_every
+
+    # antes de ceder particiones en un rebalance: lo leido queda escrito y commiteado
+    listener.on_revoke = lambda _revoked: flush()
+    try:
+        while processed < total_target:
+            size = int(size_fn() if size_fn else args.batch_size)
+            wait_ms = args.max_latency_ms
+            if st["first"] is not None:
+                wait_ms = max(0.0, args.max_latency_ms - (time.monotonic() - st["first"]) * 1000.0)
+            records = consumer.poll(timeout_ms=int(wait_ms), max_records=max(1, size - len(st["buf"])))
+            now = time.monotonic()
+            for tp, msgs in records.items():
+                for rec in msgs:
+                    d = to_minimal(rec.value, trace=True)
+                    if d.get("comment"):
+                        st["buf"].append(d)
+                    st["offs"][tp] = rec.offset
+                    if st["first"] is None:
+                        st["first"] = now
+            if st["offs"] and (len(st["buf"]) >= size or (now - st["first"]) * 1000.0 >= args.max_latency_ms):
+                flush()
+        flush()
+    except GracefulExit:
+        log.info("Drenando micro-lote en curso...")
+        flush()
+        raise
+    finally:
+        listener.on_revoke = None
+        consumer.close()
+    return processed
+
+
+class WorkWaiter:
+    """
+    Espera cuando el claim vuelve vacio:
+      - changestream: un hilo sigue coll.watch() y despierta al llegar inserts; en reposo
+        solo re-consulta cada --idle-recheck s (para leases vencidos).
+      - backoff: polling con espera exponencial BACKOFF_MIN .. --poll-wait.
+      - poll: espera fija --poll-wait (comportamiento original).
+    Si el change stream no esta disponible (Mongo standalone) cae a backoff.
+    El evento se limpia con arm() ANTES de cada claim, no despues de esperar: un insert
+    que llega mientras corre el claim deja el evento puesto y el wait() siguiente vuelve
+    de inmediato, en vez de perderse hasta el proximo --idle-recheck.
+    """
+
+    BACKOFF_MIN = 0.05
+
+    def __init__(self, coll, mode: str, poll_wait: float, idle_recheck: float, log: logging.Logger):
+        self.coll = coll
+        self.mode = mode
+        self.poll_wait = poll_wait
+        self.idle_recheck = idle_recheck
+        self.log = log
+        self.event = threading.Event()
+        self.delay = self.BACKOFF_MIN
+        self.stream_ok = False
+        self.closed = False
+        if mode == "changestream":
+            threading.Thread(target=self._watch, name="changestream", daemon=True).start()
+
+    def _watch(self) -> None:
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "replace"]}}}]
+        while not self.closed:
+            try:
+                with self.coll.watch(pipeline) as stream:
+                    self.stream_ok = True
+                    self.event.set()
+                    for _change in stream:
+                        self.event.set()
+                        if self.closed:
+                            return
+            except Exception as e:
+                if not self.stream_ok:
+                    self.log.warning(f"change streams no disponibles ({e}); usando polling con backoff")
+                    return
+                self.log.warning(f"change stream interrumpido ({e}); reintentando")
+                self.stream_ok = False
+                time.sleep(1.0)
+
+    def arm(self) -> None:
+        if not self.closed:
+            self.event.clear()
+
+    def found(self) -> None:
+        self.delay = self.BACKOFF_MIN
+
+    def wait(self) -> None:
+        if self.mode == "poll":
+            self.event.wait(self.poll_wait)
+        elif self.stream_ok:
+            self.event.wait(self.idle_recheck)
+        else:
+            self.event.wait(self.delay)
+            self.delay = min(self.delay * 2, self.poll_wait)
+
+    def wake(self) -> None:
+        self.event.set()
+
+    def close(self) -> None:
+        self.closed = True
+        self.event.set()
+
+
 class GracefulExit(Exception):
     pass
 
@@ -165,89 +1492,215 @@ def install_signal_handlers(log: logging.Logger):
 
 
 def main():
+    timer = StartupTimer()
     args = parse_args()
     log = get_logger()
     install_signal_handlers(log)
+    timer.mark("args")
 
-    # Conexiones
-    mongo = MongoClient(args.mongo_uri)
+    # Conexiones (antes de importar torch: una mala configuracion falla en ms, no en segundos)
+    mongo = MongoClient(args.mongo_uri, serverSelectionTimeoutMS=10000)
+    try:
+        mongo.admin.command("ping")
+    except Exception as e:
+        raise SystemExit(f"Error conectando a MongoDB: {e}")
     coll = mongo[args.mongo_db][args.mongo_coll]
+    worker_id = args.worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    stream = bool(args.kafka_bootstrap)
+    if args.claim_mode == "lease" and not stream:
+        ensure_claim_index(coll)
+    timer.mark("mongo")
     conn = connect_mysql(args)
-    cursor = conn.cursor(prepared=True)
-    insert_sql = build_insert_sql(args.upsert)
+    if not args.no_rollup:
+        ensure_rollup_table(conn)
+    # modo stream: at-least-once, un lote re-entregado debe ser idempotente
+    insert_sql = build_insert_sql(args.upsert or stream)
+    timer.mark("mysql")
+    consumer = listener = audit = None
+    if stream:
+        from consumer_to_mongo import RevokeListener, build_consumer
+        listener = RevokeListener()
+        consumer = build_consumer(types.SimpleNamespace(bootstrap=args.kafka_bootstrap, group=args.kafka_group,
+                                                        topic=args.kafka_topic), listener)
+        audit = AuditSink(coll, args.audit_inflight, args.audit_spill, log)
+        if args.workers > 1 or args.pipeline:
+            log.warning("modo stream: --workers/--pipeline no aplican; inferencia en el hilo del consumidor")
+        timer.mark("kafka")
 
-    # Modelo HF (sin pipeline)
-    log.info(f"Cargando modelo: {args.model}")
-    tok = AutoTokenizer.from_pretrained(args.model)
-    mdl = AutoModelForSequenceClassification.from_pretrained(args.model)
-    mdl.eval()
+    # Modelo HF (sin pipeline), desde el Hub/cache o desde --snapshot
+    tok, mdl, id2label, model_name, engine = load_model(args, log, timer)
+    log.info(f"Engine: {engine} | clases del modelo: {id2label}")
+    infer_batch(mdl, encode_batch(tok, [{"comment": "arranque"}], args.max_length), id2label)
+    timer.mark("primera_prediccion")
+    log.info(f"arranque: {timer.summary()}")
 
-    # Info de clases
-    id2label = getattr(mdl.config, "id2label", {0: "Very Negative", 1: "Negative", 2: "Neutral", 3: "Positive", 4: "Very Positive"})
-    log.info(f"Clases del modelo: {id2label}")
+    claim_lat = LatencyWindow()
+    pad_stats = PaddingStats()
+    metrics = TraceMetrics(args.metrics_file, args.metrics_every, component=f"worker-{worker_id}")
+    cache = None
+    if args.cache_size > 0:
+        cache = PredictionCache(model_name, args.max_length, args.cache_size, args.redis_url, args.cache_ttl,
+                                engine=engine)
 
-    total_target = args.max_docs if args.max_docs > 0 else float("inf")
-    processed = 0
+    waiter = None if stream else WorkWaiter(coll, args.wakeup, args.poll_wait, args.idle_recheck, log)
 
-    while processed < total_target:
-        batch = lock_batch(coll, args.batch_size)
-        if not batch:
-            time.sleep(args.poll_wait)
-            continue
+    def backlog(limit: int) -> int:
+        if stream:
+            return kafka_lag(consumer, limit)
+        flt = claimable_filter(args.lease_secs) if args.claim_mode == "lease" else {"proc": {"$exists": False}}
+        return coll.count_documents(flt, limit=limit)
 
-        texts = [essential_str(d.get("comment", "")).strip() or " " for d in batch]
+    batch_ctl = None
+    if args.adaptive_batch:
+        batch_ctl = BatchController(args.batch_size, args.min_batch, args.max_batch, args.target_p95_ms,
+                                    backlog, log, args.adapt_every)
+        log.info(f"lote adaptativo: inicial={batch_ctl.size()} rango=[{args.min_batch}, {args.max_batch}] "
+                 f"p95 objetivo={args.target_p95_ms:.0f}ms")
+    if batch_ctl is not None:
+        size_fn = batch_ctl.size
+    elif args.max_tokens and args.bucketing:
+        size_fn = lambda: token_budget_size(pad_stats, args.max_tokens, args.batch_size, args.max_batch)
+    else:
+        size_fn = lambda: args.batch_size
 
-        try:
-            enc = tok(texts, padding=True, truncation=True, max_length=args.max_length, return_tensors="pt")
-            with torch.no_grad():
-                out = mdl(**enc)
-            probs = F.softmax(out.logits, dim=-1)
-        except Exception as e:
-            # Marca todo el lote como error de inferencia
-            err = f"inferencia_fallo: {e}"
-            for d in batch:
-                coll.update_one({"_id": d["_id"]}, {"$set": {"proc.status": "error", "proc.ts": utcnow_iso(), "proc.error": err}})
-            log.error(err)
-            continue
+    def claim(n: int) -> List[dict]:
+        waiter.arm()  # un wake() desde aqui en adelante sobrevive hasta el proximo wait()
+        t0 = time.perf_counter()
+        if args.claim_mode == "lease":
+            batch = lock_batch_lease(coll, n, worker_id, args.lease_secs)
+        else:
+            batch = lock_batch(coll, n)
+        claim_lat.add((time.perf_counter() - t0) * 1000.0)
+        if batch:
+            waiter.found()
+            stamp(batch, "claim")
+        return batch
+
+    def mark_errors(batch: List[dict], err: str) -> None:
+        if stream:
+            audit.submit([audit_doc(d, err=err) for d in batch])
+        else:
+            apply_mongo_ops(coll, [mark_error_op(d, err) for d in batch], log)
 
-        for d, prob in zip(batch, probs):
+    def prepare(batch: List[dict]):
+        # Los aciertos de cache no pasan por tokenizacion ni inferencia
+        hits, misses = split_cached(cache, batch)
+        parts = []
+        if misses:
             try:
-                idx = int(torch.argmax(prob).item())
-                label = label_code_from_id2label(idx, id2label)
-                score = float(prob[idx].item())
-
-                raw_json = json.dumps(d, ensure_ascii=False) if args.raw_json else None
-                params = (
-                    str(d.get("_id")),
-                    essential_str(d.get("user_id", "")),
-                    essential_str(d.get("comment", "")),
-                    label,
-                    score,
-                    raw_json,
-                )
-                cursor.execute(insert_sql, params)
-
-                coll.update_one(
-                    {"_id": d["_id"]},
-                    {"$set": {"proc.status": "done", "proc.ts": utcnow_iso(), "pred.label": label, "pred.score": score}},
-                )
-
-                processed += 1
-                if processed % args.log_every == 0:
-                    log.info(f"Procesados: {processed}")
-
-                if processed >= total_target:
-                    break
-
-            except mysql.connector.Error as me:
-                # Error de MySQL: marcar doc en error
-                err = f"mysql_error: {getattr(me, 'msg', me)}"
-                coll.update_one({"_id": d["_id"]}, {"$set": {"proc.status": "error", "proc.ts": utcnow_iso(), "proc.error": err}})
+                parts = encode_batch(tok, misses, args.max_length, args.bucketing, args.max_tokens, pad_stats,
+                                     dedup=True)
+            except Exception as e:
+                err = f"inferencia_fallo: {e}"
+                mark_errors(misses, err)
                 log.error(err)
+                misses = []
+        return hits, misses, parts
+
+    def predict(item) -> Optional[List[tuple]]:
+        hits, misses, parts = item
+        stamp([h[0] for h in hits], "infer")
+        fresh = []
+        if parts:
+            try:
+                fresh = infer_batch(mdl, parts, id2label)
+                stamp([r[0] for r in fresh], "infer")
+                if cache is not None:
+                    cache.put_many([(model_text(d), label, score) for d, label, score in fresh])
             except Exception as e:
-                err = f"proc_error: {e}"
-                coll.update_one({"_id": d["_id"]}, {"$set": {"proc.status": "error", "proc.ts": utcnow_iso(), "proc.error": err}})
+                # Marca los documentos inferidos del lote como error de inferencia
+                err = f"inferencia_fallo: {e}"
+                mark_errors(misses, err)
                 log.error(err)
+        return (hits + fresh) or None
+
+    def write_stream(results: List[tuple]) -> int:
+        # Sin exito en MySQL no se vuelve a run_stream, asi sus offsets no se commitean
+        backoff = 0.5
+        while True:
+            try:
+                n, docs = sink_stream_batch(conn, insert_sql, results, args.raw_json, log, metrics,
+                                            rollup=not args.no_rollup)
+                break
+            except mysql.connector.Error as e:
+                log.error(f"MySQL no disponible ({getattr(e, 'msg', e)}); reintento en {backoff:.1f}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 10.0)
+                try:
+                    conn.reconnect(attempts=1, delay=0)
+                except mysql.connector.Error:
+                    pass
+        audit.submit(docs)  # no bloquea: con la cola llena va a --audit-spill
+        return n
+
+    first_sink = [True]
+
+    def sink(results: List[tuple]) -> int:
+        t0 = time.time()
+        if stream:
+            n = write_stream(results)
+        else:
+            n = sink_batch(conn, coll, insert_sql, results, args.raw_json, log, metrics, rollup=not args.no_rollup)
+        if first_sink[0] and n:
+            first_sink[0] = False
+            log.info(f"primer lote escrito a {timer.total_ms():.0f}ms del arranque")
+        if batch_ctl is not None and results:
+            # claim/infer los estampa el propio worker en el trace de cada documento; la
+            # llegada es la primera etapa previa que traiga (produce del productor, consume
+            # = primer poll en modo stream, mongo con consumer_to_mongo --trace) o el claim
+            t1 = time.time()
+            tr = [d["trace"] for d, _label, _score in results]
+            claimed = min(t.get("claim", t0) for t in tr)
+            inferred = max(t.get("infer", t0) for t in tr)
+            arrived = min(min((t[k] for k in ARRIVAL_STAGES if k in t), default=claimed) for t in tr)
+            batch_ctl.observe(len(results), (inferred - claimed) * 1000.0, (t1 - t0) * 1000.0,
+                              (t1 - claimed) * 1000.0, (claimed - arrived) * 1000.0)
+        return n
+
+    def stats() -> str:
+        out = f"{'microlote' if stream else 'claim'} {claim_lat.summary()} | {pad_stats.summary()}"
+        out += f" | auditoria {audit.report()}" if audit is not None else ""
+        out += f" | {batch_ctl.summary()}" if batch_ctl is not None else ""
+        return out + (f" | {cache.summary()}" if cache is not None else "")
+
+    def run_serial() -> int:
+        total_target = args.max_docs if args.max_docs > 0 else float("inf")
+        processed = 0
+        next_log = args.log_every
+
+        while processed < total_target:
+            batch = claim(int(min(size_fn(), total_target - processed)))
+            if not batch:
+                waiter.wait()
+                continue
+
+            results = predict(prepare(batch))
+            if not results:
+                continue
+
+            processed += sink(results)
+            if processed >= next_log:
+                log.info(f"Procesados: {processed} | {stats()}")
+                next_log = processed + args.log_every
+        return processed
+
+    try:
+        if stream:
+            log.info(f"modo stream: {args.kafka_topic} -> inferencia -> MySQL (auditoria asincrona en Mongo)")
+            processed = run_stream(consumer, listener, prepare, predict, sink, args, log, stats, claim_lat, size_fn)
+        elif args.workers > 1:
+            processed = run_sharded(claim, sink, mark_errors, cache, tok, mdl, id2label, waiter, args, log, stats,
+                                    pad_stats, size_fn)
+        elif args.pipeline:
+            processed = run_pipeline(claim, prepare, predict, sink, waiter, args, log, stats, size_fn)
+        else:
+            processed = run_serial()
+    finally:
+        if waiter is not None:
+            waiter.close()
+        if audit is not None:
+            audit.close()
+        metrics.close()
 
     log.info(f"Listo. Total procesados: {processed}")
 
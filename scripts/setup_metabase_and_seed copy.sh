@@ -1,5 +1,5 @@
 #!/usr/bin/env bash
-# Configura Metabase y crea 3 visualizaciones + dashboard (idempotente).
+# Configura Metabase y crea 4 visualizaciones + dashboard (idempotente).
 # Requiere: docker, curl, python3. Usa helpers /opt/lab/bin/start_*.sh si existen.
 
 set -eu
@@ -204,14 +204,16 @@ CARD_NAME="$name" CARD_SQL="$sql" CARD_DISPLAY="$display" DB_ID="$db_id"
   echo "$cid"
 }
 
-SQL1="SELECT sentiment_label, COUNT(*) AS n FROM dw_messages GROUP BY sentiment_label ORDER BY n DESC;"
+SQL1="SELECT sentiment_label, SUM(n) AS n FROM dw_sentiment_daily GROUP BY sentiment_label ORDER BY n DESC;"
 SQL2="SELECT DATE_FORMAT(ingest_ts, '%Y-%m-%d %H:%i:00') AS minute, sentiment_label, COUNT(*) AS n FROM dw_messages GROUP BY minute, sentiment_label ORDER BY minute ASC;"
 SQL3="SELECT user_id, COUNT(*) AS n_neg FROM dw_messages WHERE sentiment_label IN ('vneg','neg') GROUP BY user_id ORDER BY n_neg DESC LIMIT 10;"
+SQL4="SELECT day, sentiment_label, n, score_sum / n AS avg_score FROM dw_sentiment_daily ORDER BY day ASC;"
 
 CARD1_ID="$(create_card '01 Distribucion por sentimiento' "$SQL1" 'bar')"
 CARD2_ID="$(create_card '02 Serie por minuto (stacked)' "$SQL2" 'area')"
 CARD3_ID="$(create_card '03 Top usuarios negativos' "$SQL3" 'bar')"
-log "cards: $CARD1_ID, $CARD2_ID, $CARD3_ID"
+CARD4_ID="$(create_card '04 Serie diaria (rollup)' "$SQL4" 'area')"
+log "cards: $CARD1_ID, $CARD2_ID, $CARD3_ID, $CARD4_ID"
 
 # 7) Crear (o reutilizar) dashboard y agregar cards
 dash_id="$(api_get "${MB_URL}/api/dashboard" | python3 - <<'PY'
@@ -261,6 +263,7 @@ CID="$cid" ROW="$row" COL="$col" SX="$sx" SY="$sy"
 add_card "$dash_id" "$CARD1_ID" 0 0 12 8
 add_card "$dash_id" "$CARD2_ID" 8 0 24 10
 add_card "$dash_id" "$CARD3_ID" 0 12 12 8
+add_card "$dash_id" "$CARD4_ID" 18 0 24 10
 
-log "Listo. Dashboard '${DASHBOARD_NAME}' y 3 visualizaciones configuradas."
+log "Listo. Dashboard '${DASHBOARD_NAME}' y 4 visualizaciones configuradas."
 echo "URL (via tunel): ${MB_URL}"
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Snapshot local del modelo del worker para arranque rapido y offline
+(sentiment_dl_worker.py --snapshot DIR).
+
+Guarda en --out:
+  - tokenizer (tokenizer.json rapido + config) via save_pretrained
+  - modelo en safetensors (model.safetensors + config.json) via save_pretrained
+  - traced.pt: con --engine torchscript o int8-dynamic, el modulo TorchScript ya
+    trazado y congelado (int8-dynamic: cuantizado y luego trazado); el worker lo carga
+    con torch.jit.load sin instanciar el modelo HF ni volver a trazar
+  - snapshot.json: manifiesto (modelo de origen, engine, id2label, max_length, versiones);
+    se escribe al final, asi un directorio sin manifiesto es un snapshot incompleto
+
+Antes de escribir el manifiesto compara el modelo trazado recargado contra eager en
+unos textos de ejemplo (misma etiqueta y diferencia maxima de score).
+
+USO
+  python scripts/snapshot_model.py --out /opt/models/sentiment --engine torchscript
+  HF_HUB_OFFLINE=1 python scripts/sentiment_dl_worker.py ... --snapshot /opt/models/sentiment
+
+Requisitos:
+  pip install torch transformers safetensors
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import torch
+import transformers
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+from sentiment_dl_worker import (SNAPSHOT_MANIFEST, SNAPSHOT_TRACED, TracedModel, build_engine, encode_batch,
+                                 infer_batch)
+
+CHECK_TEXTS = [
+    "Me encanta este producto, funciona perfecto",
+    "Horrible servicio, nunca mas vuelvo",
+    "El paquete llego el martes",
+    "not bad at all, I would buy it again",
+    "worst purchase ever, total waste of money and time",
+]
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Snapshot local del modelo (safetensors + TorchScript) para el worker")
+    p.add_argument("--model", default="tabularisai/multilingual-sentiment-analysis")
+    p.add_argument("--out", required=True, help="directorio destino (se crea si no existe)")
+    p.add_argument("--engine", choices=["eager", "int8-dynamic", "torchscript"], default="torchscript",
+                   help="engine por defecto del snapshot; eager = solo safetensors, sin traced.pt")
+    p.add_argument("--max-length", type=int, default=256)
+    return p.parse_args()
+
+
+def dir_size_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 1e6
+
+
+def main():
+    args = parse_args()
+    os.makedirs(args.out, exist_ok=True)
+    times = {}
+
+    t0 = time.perf_counter()
+    tok = AutoTokenizer.from_pretrained(args.model)
+    mdl = AutoModelForSequenceClassification.from_pretrained(args.model)
+    mdl.eval()
+    id2label = {int(k): v for k, v in mdl.config.id2label.items()}
+    times["load_hub_s"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    tok.save_pretrained(args.out)
+    mdl.save_pretrained(args.out, safe_serialization=True)
+    times["save_safetensors_s"] = time.perf_counter() - t0
+
+    docs = [{"comment": t} for t in CHECK_TEXTS]
+    ref = infer_batch(mdl, encode_batch(tok, docs, args.max_length), id2label)
+
+    traced_file = None
+    check = None
+    if args.engine != "eager":
+        t0 = time.perf_counter()
+        eng = mdl
+        if args.engine == "int8-dynamic":
+            eng = build_engine(eng, tok, "int8-dynamic", args.max_length)
+        # build_engine deja config.return_dict=False; los safetensors ya estan guardados
+        eng = build_engine(eng, tok, "torchscript", args.max_length)
+        torch.jit.save(eng.traced, os.path.join(args.out, SNAPSHOT_TRACED))
+        traced_file = SNAPSHOT_TRACED
+        times["trace_save_s"] = time.perf_counter() - t0
+
+        reloaded = TracedModel(torch.jit.load(os.path.join(args.out, SNAPSHOT_TRACED)).eval())
+        got = infer_batch(reloaded, encode_batch(tok, docs, args.max_length), id2label)
+        check = {"label_agreement": sum(1 for a, b in zip(ref, got) if a[1] == b[1]) / len(ref),
+                 "score_drift_max": round(max(abs(a[2] - b[2]) for a, b in zip(ref, got)), 5)}
+
+    manifest = {
+        "model": args.model,
+        "engine": args.engine,
+        "traced": traced_file,
+        "id2label": id2label,
+        "max_length": args.max_length,
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    tmp = os.path.join(args.out, SNAPSHOT_MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(args.out, SNAPSHOT_MANIFEST))
+
+    print(json.dumps({"out": args.out, "engine": args.engine, "size_mb": round(dir_size_mb(args.out), 1),
+                      "check": check, **{k: round(v, 2) for k, v in times.items()}}), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Trazas de latencia extremo a extremo del pipeline (compartido por consumer_to_mongo.py
+y sentiment_dl_worker.py).
+
+Con consumer_to_mongo.py --trace cada documento lleva un subdocumento 'trace' con
+epoch (segundos) por etapa:
+  produce  meta.ts del productor (send_kafka_burst.py)
+  consume  el consumer lo leyo de Kafka
+  mongo    el consumer lo escribio en Mongo
+  claim    el worker lo tomo
+  infer    el worker termino la inferencia
+  commit   el worker hizo commit en MySQL (dw_messages)
+
+TraceMetrics acumula un histograma por tramo entre etapas consecutivas presentes
+(p.ej. 'claim->infer') mas 'total' (primera -> ultima) y lo vuelca periodicamente
+a un archivo JSON (escritura atomica), sin dependencias ni servidor HTTP.
+
+En dw_messages el trace no tiene columna propia: solo queda dentro de raw_json con
+sentiment_dl_worker.py --raw-json, y hasta 'infer' (la fila se arma antes del commit;
+ese instante lo da ingest_ts). El trace completo con 'commit' solo llega a los
+histogramas de --metrics-file.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional
+
+TRACE_ORDER = ("produce", "consume", "mongo", "claim", "infer", "commit")
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000, 300000)
+
+
+def parse_ts(v) -> Optional[float]:
+    """ISO-8601 (meta.ts) o epoch -> epoch en segundos; None si no se puede leer."""
+    if v is None:
+        return None
+    if isinstance(v, (int, float)):
+        return float(v)
+    try:
+        return datetime.fromisoformat(str(v).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def stamp(docs, stage: str, now: Optional[float] = None) -> None:
+    now = time.time() if now is None else now
+    for d in docs:
+        tr = d.get("trace")
+        if not isinstance(tr, dict):
+            tr = d["trace"] = {}
+        tr[stage] = now
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.n = 0
+        self.sum_ms = 0.0
+        self.recent = deque(maxlen=4096)
+
+    def observe(self, ms: float) -> None:
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.n += 1
+        self.sum_ms += ms
+        self.recent.append(ms)
+
+    def snapshot(self) -> dict:
+        data = sorted(self.recent)
+
+        def pct(q):
+            return round(data[min(len(data) - 1, int(q / 100.0 * len(data)))], 2) if data else None
+
+        buckets = {f"le_{b}": c for b, c in zip(BUCKETS_MS, self.counts)}
+        buckets["le_inf"] = self.counts[-1]
+        return {"count": self.n, "mean_ms": round(self.sum_ms / self.n, 2) if self.n else None,
+                "p50_ms": pct(50), "p95_ms": pct(95), "p99_ms": pct(99), "buckets": buckets}
+
+
+class TraceMetrics:
+    """
+    Histogramas por tramo. Con path, un hilo vuelca el JSON cada 'every' segundos.
+    """
+
+    def __init__(self, path: Optional[str], every: float = 10.0, component: str = ""):
+        self.path = path
+        self.every = every
+        self.component = component
+        self.hist: Dict[str, Histogram] = {}
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        if path:
+            threading.Thread(target=self._loop, name="metrics-file", daemon=True).start()
+
+    def observe(self, name: str, ms: float) -> None:
+        with self.lock:
+            h = self.hist.get(name)
+            if h is None:
+                h = self.hist[name] = Histogram()
+            h.observe(ms)
+
+    def observe_trace(self, trace) -> None:
+        if not isinstance(trace, dict):
+            return
+        pts = [(k, trace[k]) for k in TRACE_ORDER if isinstance(trace.get(k), (int, float))]
+        for (a, ta), (b, tb) in zip(pts, pts[1:]):
+            self.observe(f"{a}->{b}", (tb - ta) * 1000.0)
+        if len(pts) > 2:
+            self.observe("total", (pts[-1][1] - pts[0][1]) * 1000.0)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            stages = {k: h.snapshot() for k, h in self.hist.items()}
+        return {"component": self.component, "pid": os.getpid(), "ts": time.time(), "stages": stages}
+
+    def write(self) -> None:
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=1)
+        os.replace(tmp, self.path)
+
+    def _loop(self) -> None:
+        while not self.closed.wait(self.every):
+            try:
+                self.write()
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        self.closed.set()
+        try:
+            self.write()
+        except OSError:
+            pass